@@ -2,6 +2,8 @@ from dotenv import load_dotenv
 from openai import OpenAI
 import json
 import os
+import threading
+import time
 import requests
 from pypdf import PdfReader
 import gradio as gr
@@ -10,14 +12,29 @@ import gradio as gr
 load_dotenv(override=True)
 
 def push(text):
-    requests.post(
-        "https://api.pushover.net/1/messages.json",
-        data={
-            "token": os.getenv("PUSHOVER_TOKEN"),
-            "user": os.getenv("PUSHOVER_USER"),
-            "message": text,
-        }
-    )
+    # Send in the background so the chat reply doesn't wait on Pushover
+    threading.Thread(target=send_push, args=(text,), daemon=True).start()
+
+
+def send_push(text, attempts=3):
+    for attempt in range(attempts):
+        try:
+            response = requests.post(
+                os.getenv("PUSHOVER_URL", "https://api.pushover.net/1/messages.json"),
+                data={
+                    "token": os.getenv("PUSHOVER_TOKEN"),
+                    "user": os.getenv("PUSHOVER_USER"),
+                    "message": text,
+                },
+                timeout=10,
+            )
+            if response.ok:
+                return
+        except requests.RequestException:
+            pass
+        if attempt + 1 < attempts:
+            time.sleep(2 ** attempt)
+    print(f"Push notification failed: {text}")
 
 
 def record_user_details(email, name="Name not provided", notes="not provided"):
@@ -2,6 +2,7 @@ from crewai.tools import BaseTool
 from typing import Type
 from pydantic import BaseModel, Field
 import os
+import time
 import requests
 
 
@@ -21,9 +22,19 @@ class PushNotificationTool(BaseTool):
     def _run(self, message: str) -> str:
         pushover_user = os.getenv("PUSHOVER_USER")
         pushover_token = os.getenv("PUSHOVER_TOKEN")
-        pushover_url = "https://api.pushover.net/1/messages.json"
+        pushover_url = os.getenv("PUSHOVER_URL", "https://api.pushover.net/1/messages.json")
 
         print(f"Push: {message}")
         payload = {"user": pushover_user, "token": pushover_token, "message": message}
-        requests.post(pushover_url, data=payload)
-        return '{"notification": "ok"}'
\ No newline at end of file
+        # The crew finishes soon after this, so send now, but don't hang on or give up at the first failure:
+        # two tries of up to 5 seconds, a second apart
+        attempts = 2
+        for attempt in range(attempts):
+            try:
+                if requests.post(pushover_url, data=payload, timeout=5).ok:
+                    return '{"notification": "ok"}'
+            except requests.RequestException:
+                pass
+            if attempt + 1 < attempts:
+                time.sleep(2 ** attempt)
+        return '{"notification": "failed"}'
\ No newline at end of file
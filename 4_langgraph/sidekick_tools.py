@@ -2,6 +2,8 @@ from playwright.async_api import async_playwright
 from langchain_community.agent_toolkits import PlayWrightBrowserToolkit
 from dotenv import load_dotenv
 import os
+import threading
+import time
 import requests
 from langchain.agents import Tool
 from langchain_community.agent_toolkits import FileManagementToolkit
@@ -15,7 +17,7 @@ from langchain_community.utilities.wikipedia import WikipediaAPIWrapper
 load_dotenv(override=True)
 pushover_token = os.getenv("PUSHOVER_TOKEN")
 pushover_user = os.getenv("PUSHOVER_USER")
-pushover_url = "https://api.pushover.net/1/messages.json"
+pushover_url = os.getenv("PUSHOVER_URL", "https://api.pushover.net/1/messages.json")
 serper = GoogleSerperAPIWrapper()
 
 async def playwright_tools():
@@ -27,10 +29,28 @@ async def playwright_tools():
 
 def push(text: str):
     """Send a push notification to the user"""
-    requests.post(pushover_url, data = {"token": pushover_token, "user": pushover_user, "message": text})
+    # Sent in the background, so the agent carries on without waiting for Pushover
+    threading.Thread(target=send_push, args=(text,), daemon=True).start()
     return "success"
 
 
+def send_push(text: str, attempts: int = 3):
+    for attempt in range(attempts):
+        try:
+            response = requests.post(
+                pushover_url,
+                data={"token": pushover_token, "user": pushover_user, "message": text},
+                timeout=10,
+            )
+            if response.ok:
+                return
+        except requests.RequestException:
+            pass
+        if attempt + 1 < attempts:
+            time.sleep(2 ** attempt)
+    print(f"Push notification failed: {text}")
+
+
 def get_file_tools():
     toolkit = FileManagementToolkit(root_dir="sandbox")
     return toolkit.get_tools()
@@ -1,14 +1,54 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
+from typing import Literal
+from functools import wraps
 import json
+import os
 from dotenv import load_dotenv
 from datetime import datetime
-from market import get_share_price
-from database import write_account, read_account, write_log
+from market import get_share_price, get_share_prices
+from valuation import PortfolioValuation
+from database import (
+    write_account,
+    read_account,
+    ConcurrentUpdateError,
+    write_account_details,
+    write_trade,
+    write_trades,
+    read_transactions,
+    read_recent_transactions,
+    write_portfolio_value,
+    read_portfolio_values,
+    write_log,
+)
 
 load_dotenv(override=True)
 
 INITIAL_BALANCE = 10_000.0
 SPREAD = 0.002
+# How much of the account report() includes, from least to most
+REPORT_VIEWS = ("summary", "holdings", "recent", "full")
+RECENT_TRANSACTIONS = 10
+# How many times an update that lost a race with another writer is retried against a fresh read
+ACCOUNT_UPDATE_RETRIES = int(os.getenv("ACCOUNT_UPDATE_RETRIES", "5"))
+
+
+def retry_on_conflict(method):
+    """
+    Retry an Account method whose write was refused because another process or thread updated
+    the account after it was read: the account is reloaded and the method run again from the top,
+    so its checks - funds, shares held - are made against the latest state.
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        for _ in range(ACCOUNT_UPDATE_RETRIES):
+            try:
+                return method(self, *args, **kwargs)
+            except ConcurrentUpdateError:
+                self.reload()
+        return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class Transaction(BaseModel):
@@ -25,16 +65,29 @@ class Transaction(BaseModel):
         return f"{abs(self.quantity)} shares of {self.symbol} at {self.price} each."
 
 
+class Order(BaseModel):
+    symbol: str
+    side: Literal["buy", "sell"]
+    quantity: int
+    rationale: str
+
+
 class Account(BaseModel):
     name: str
     balance: float
     strategy: str
     holdings: dict[str, int]
-    transactions: list[Transaction]
-    portfolio_value_time_series: list[tuple[str, float]]
+    cost_basis: dict[str, float] = {}
+    realized_pnl: float = 0.0
+    total_invested: float = 0.0
+    version: int = 0
+    _transactions: list[Transaction] | None = PrivateAttr(default=None)
+    _portfolio_value_time_series: list[tuple[str, float]] | None = PrivateAttr(default=None)
+    _valuation: PortfolioValuation = PrivateAttr(default_factory=PortfolioValuation)
 
     @classmethod
     def get(cls, name: str):
+        """ Load an account; its transactions and portfolio values are only read when first used. """
         fields = read_account(name.lower())
         if not fields:
             fields = {
@@ -42,24 +95,91 @@ class Account(BaseModel):
                 "balance": INITIAL_BALANCE,
                 "strategy": "",
                 "holdings": {},
-                "transactions": [],
-                "portfolio_value_time_series": []
             }
-            write_account(name, fields)
+            fields["version"] = write_account(name, fields)
         return cls(**fields)
-    
-    
+
+    def reload(self):
+        """ Re-read the account, after another writer changed it, dropping anything cached from before. """
+        for field, value in read_account(self.name).items():
+            setattr(self, field, value)
+        self._transactions = None
+        self._portfolio_value_time_series = None
+        self._valuation = PortfolioValuation()
+
+    @property
+    def transactions(self) -> list[Transaction]:
+        if self._transactions is None:
+            self._transactions = [Transaction(**t) for t in read_transactions(self.name)]
+        return self._transactions
+
+    @property
+    def portfolio_value_time_series(self) -> list[tuple[str, float]]:
+        if self._portfolio_value_time_series is None:
+            self._portfolio_value_time_series = read_portfolio_values(self.name)
+        return self._portfolio_value_time_series
+
     def save(self):
-        write_account(self.name.lower(), self.model_dump())
+        write_account_details(self.name.lower(), self.model_dump())
+        self.version += 1
 
     def reset(self, strategy: str):
         self.balance = INITIAL_BALANCE
         self.strategy = strategy
         self.holdings = {}
-        self.transactions = []
-        self.portfolio_value_time_series = []
-        self.save()
+        self.cost_basis = {}
+        self.realized_pnl = 0.0
+        self.total_invested = 0.0
+        self._transactions = []
+        self._portfolio_value_time_series = []
+        self._valuation = PortfolioValuation()
+        self.version = write_account(self.name, {"balance": self.balance, "strategy": self.strategy})
+
+    def record_trade(self, transaction: Transaction):
+        """ Append a transaction and persist it with the new balance and holding, without rewriting history. """
+        if self._transactions is not None:
+            self._transactions.append(transaction)
+        self.update_cost_basis(transaction)
+        symbol = transaction.symbol
+        fields = {
+            "balance": self.balance,
+            "strategy": self.strategy,
+            "realized_pnl": self.realized_pnl,
+            "total_invested": self.total_invested,
+            "version": self.version,
+        }
+        write_trade(
+            self.name,
+            fields,
+            symbol,
+            self.holdings.get(symbol, 0),
+            self.cost_basis.get(symbol, 0.0),
+            transaction.model_dump(),
+        )
+        self.version += 1
 
+    def update_cost_basis(self, transaction: Transaction):
+        """ Roll a transaction, already applied to holdings, into the running average-cost aggregates. """
+        symbol, quantity, price = transaction.symbol, transaction.quantity, transaction.price
+        self.total_invested += transaction.total()
+        if quantity > 0:
+            self.cost_basis[symbol] = self.cost_basis.get(symbol, 0.0) + transaction.total()
+            return
+        held_before = self.holdings.get(symbol, 0) - quantity
+        average_cost = self.cost_basis.get(symbol, 0.0) / held_before
+        self.realized_pnl += -quantity * (price - average_cost)
+        if symbol in self.holdings:
+            self.cost_basis[symbol] += quantity * average_cost
+        else:
+            self.cost_basis.pop(symbol, None)
+
+    def record_portfolio_value(self, portfolio_value: float):
+        point = (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value)
+        if self._portfolio_value_time_series is not None:
+            self._portfolio_value_time_series.append(point)
+        write_portfolio_value(self.name, *point)
+
+    @retry_on_conflict
     def deposit(self, amount: float):
         """ Deposit funds into the account. """
         if amount <= 0:
@@ -68,6 +188,7 @@ class Account(BaseModel):
         print(f"Deposited ${amount}. New balance: ${self.balance}")
         self.save()
 
+    @retry_on_conflict
     def withdraw(self, amount: float):
         """ Withdraw funds from the account, ensuring it doesn't go negative. """
         if amount > self.balance:
@@ -76,6 +197,20 @@ class Account(BaseModel):
         print(f"Withdrew ${amount}. New balance: ${self.balance}")
         self.save()
 
+    def apply_trade(self, symbol: str, quantity: int, price: float, trade_price: float, rationale: str) -> Transaction:
+        """ Apply a checked trade - negative quantity for a sale - to holdings and balance in memory. """
+        # Update holdings, removing the symbol if shares are completely sold
+        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
+        if self.holdings[symbol] == 0:
+            del self.holdings[symbol]
+        self._valuation.update(symbol, self.holdings.get(symbol, 0), price)
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        transaction = Transaction(symbol=symbol, quantity=quantity, price=trade_price, timestamp=timestamp, rationale=rationale)
+        # Update balance
+        self.balance -= transaction.total()
+        return transaction
+
+    @retry_on_conflict
     def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
         """ Buy shares of a stock if sufficient funds are available. """
         price = get_share_price(symbol)
@@ -87,19 +222,12 @@ class Account(BaseModel):
         elif price==0:
             raise ValueError(f"Unrecognized symbol {symbol}")
         
-        # Update holdings
-        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
-        transaction = Transaction(symbol=symbol, quantity=quantity, price=buy_price, timestamp=timestamp, rationale=rationale)
-        self.transactions.append(transaction)
-        
-        # Update balance
-        self.balance -= total_cost
-        self.save()
+        transaction = self.apply_trade(symbol, quantity, price, buy_price, rationale)
+        self.record_trade(transaction)
         write_log(self.name, "account", f"Bought {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+        return "Completed. Latest details:\n" + self.report("holdings")
 
+    @retry_on_conflict
     def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
         """ Sell shares of a stock if the user has enough shares. """
         if self.holdings.get(symbol, 0) < quantity:
@@ -107,36 +235,83 @@ class Account(BaseModel):
         
         price = get_share_price(symbol)
         sell_price = price * (1 - SPREAD)
-        total_proceeds = sell_price * quantity
-        
-        # Update holdings
-        self.holdings[symbol] -= quantity
-        
-        # If shares are completely sold, remove from holdings
-        if self.holdings[symbol] == 0:
-            del self.holdings[symbol]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
-        transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)  # negative quantity for sell
-        self.transactions.append(transaction)
-
-        # Update balance
-        self.balance += total_proceeds
-        self.save()
+        # negative quantity for sell
+        transaction = self.apply_trade(symbol, -quantity, price, sell_price, rationale)
+        self.record_trade(transaction)
         write_log(self.name, "account", f"Sold {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+        return "Completed. Latest details:\n" + self.report("holdings")
+
+    @retry_on_conflict
+    def execute_trades(self, orders: list[Order]) -> str:
+        """
+        Buy and sell several stocks at once, all or nothing. Every symbol is priced in one batch
+        and sales are made before purchases, so their proceeds can pay for them. If any order
+        can't be filled, none are made; otherwise all are saved in a single transaction.
+        """
+        if not orders:
+            raise ValueError("No trades were made. No orders were given.")
+        prices = get_share_prices([order.symbol for order in orders])
+        orders = sorted(orders, key=lambda order: order.side != "sell")
+        holdings, balance, problems = dict(self.holdings), self.balance, []
+        for order in orders:
+            symbol, quantity, price = order.symbol, order.quantity, prices[order.symbol]
+            if quantity <= 0:
+                problems.append(f"Quantity for {symbol} must be positive")
+            elif order.side == "sell" and holdings.get(symbol, 0) < quantity:
+                problems.append(f"Cannot sell {quantity} shares of {symbol}. Not enough shares held.")
+            elif order.side == "sell":
+                holdings[symbol] -= quantity
+                balance += price * (1 - SPREAD) * quantity
+            elif price * (1 + SPREAD) * quantity > balance:
+                problems.append(f"Insufficient funds to buy {quantity} shares of {symbol}.")
+            elif price == 0:
+                problems.append(f"Unrecognized symbol {symbol}")
+            else:
+                holdings[symbol] = holdings.get(symbol, 0) + quantity
+                balance -= price * (1 + SPREAD) * quantity
+        if problems:
+            raise ValueError("No trades were made. " + " ".join(problems))
+
+        transactions = []
+        for order in orders:
+            price = prices[order.symbol]
+            if order.side == "sell":
+                transaction = self.apply_trade(order.symbol, -order.quantity, price, price * (1 - SPREAD), order.rationale)
+            else:
+                transaction = self.apply_trade(order.symbol, order.quantity, price, price * (1 + SPREAD), order.rationale)
+            if self._transactions is not None:
+                self._transactions.append(transaction)
+            self.update_cost_basis(transaction)
+            transactions.append(transaction)
+        write_trades(
+            self.name,
+            {
+                "balance": self.balance,
+                "strategy": self.strategy,
+                "realized_pnl": self.realized_pnl,
+                "total_invested": self.total_invested,
+                "version": self.version,
+            },
+            [
+                (symbol, self.holdings.get(symbol, 0), self.cost_basis.get(symbol, 0.0))
+                for symbol in dict.fromkeys(order.symbol for order in orders)
+            ],
+            [transaction.model_dump() for transaction in transactions],
+        )
+        self.version += 1
+        summary = ", ".join(
+            f"{'Bought' if order.side == 'buy' else 'Sold'} {order.quantity} of {order.symbol}" for order in orders
+        )
+        write_log(self.name, "account", summary)
+        return "Completed. Latest details:\n" + self.report("holdings")
 
     def calculate_portfolio_value(self):
         """ Calculate the total value of the user's portfolio. """
-        total_value = self.balance
-        for symbol, quantity in self.holdings.items():
-            total_value += get_share_price(symbol) * quantity
-        return total_value
+        return self.balance + self._valuation.holdings_value(self.holdings)
 
     def calculate_profit_loss(self, portfolio_value: float):
         """ Calculate profit or loss from the initial spend. """
-        initial_spend = sum(transaction.total() for transaction in self.transactions)
-        return portfolio_value - initial_spend - self.balance
+        return portfolio_value - self.total_invested - self.balance
 
     def get_holdings(self):
         """ Report the current holdings of the user. """
@@ -144,19 +319,50 @@ class Account(BaseModel):
 
     def get_profit_loss(self):
         """ Report the user's profit or loss at any point in time. """
-        return self.calculate_profit_loss()
+        return self.calculate_profit_loss(self.calculate_portfolio_value())
+
+    def get_unrealized_profit_loss(self) -> dict[str, dict[str, float]]:
+        """ Report the unrealized profit or loss of each holding against its average cost. """
+        self._valuation.holdings_value(self.holdings)
+        return {
+            symbol: {
+                "quantity": quantity,
+                "cost_basis": self.cost_basis.get(symbol, 0.0),
+                "market_value": self._valuation.values[symbol],
+                "unrealized_profit_loss": self._valuation.values[symbol] - self.cost_basis.get(symbol, 0.0),
+            }
+            for symbol, quantity in self.holdings.items()
+        }
 
     def list_transactions(self):
         """ List all transactions made by the user. """
         return [transaction.model_dump() for transaction in self.transactions]
     
-    def report(self) -> str:
-        """ Return a json string representing the account.  """
+    def list_recent_transactions(self, n: int = RECENT_TRANSACTIONS):
+        """ List the user's n most recent transactions, oldest first. """
+        if self._transactions is not None:
+            return [transaction.model_dump() for transaction in self._transactions[-n:]] if n > 0 else []
+        return read_recent_transactions(self.name, n)
+
+    def report(self, view: str = "full", transactions: int = RECENT_TRANSACTIONS) -> str:
+        """
+        Return a json string representing the account, in one of REPORT_VIEWS:
+        summary - balance, strategy, portfolio value and profit and loss;
+        holdings - the summary plus holdings and their cost basis;
+        recent - the holdings view plus the most recent transactions;
+        full - everything, including every transaction and the portfolio value time series.
+        """
+        if view not in REPORT_VIEWS:
+            raise ValueError(f"Unknown report view {view}; choose from {', '.join(REPORT_VIEWS)}")
         portfolio_value = self.calculate_portfolio_value()
-        self.portfolio_value_time_series.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value))
-        self.save()
+        self.record_portfolio_value(portfolio_value)
         pnl = self.calculate_profit_loss(portfolio_value)
-        data = self.model_dump()
+        data = self.model_dump(exclude={"holdings", "cost_basis", "version"} if view == "summary" else {"version"})
+        if view == "recent":
+            data["recent_transactions"] = self.list_recent_transactions(transactions)
+        elif view == "full":
+            data["transactions"] = self.list_transactions()
+            data["portfolio_value_time_series"] = self.portfolio_value_time_series
         data["total_portfolio_value"] = portfolio_value
         data["total_profit_loss"] = pnl
         write_log(self.name, "account", f"Retrieved account details")
@@ -167,6 +373,7 @@ class Account(BaseModel):
         write_log(self.name, "account", f"Retrieved strategy")
         return self.strategy
     
+    @retry_on_conflict
     def change_strategy(self, strategy: str) -> str:
         """ At your discretion, if you choose to, call this to change your investment strategy for the future """
         self.strategy = strategy
@@ -1,39 +1,183 @@
+import asyncio
+import os
+import anyio
 import mcp
+from contextlib import asynccontextmanager
 from mcp.client.stdio import stdio_client
 from mcp import StdioServerParameters
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
 from agents import FunctionTool
 import json
 
 params = StdioServerParameters(command="uv", args=["run", "accounts_server.py"], env=None)
 
+ACCOUNTS_SESSION_IDLE_SECONDS = float(os.getenv("ACCOUNTS_SESSION_IDLE_SECONDS", "300"))
+
+
+def session_closed(session) -> bool:
+    """
+    Whether an MCP client session's server has gone away: once a stdio server exits, the reader of
+    its output closes its end of the session's read stream. The session itself stays open until
+    whoever started it shuts it down.
+    """
+    read_stream = getattr(session, "_read_stream", None)
+    return read_stream is not None and read_stream.statistics().open_send_streams == 0
+
+
+def connection_lost(error: Exception) -> bool:
+    """Whether a request failed because the connection to the server is gone"""
+    if isinstance(error, McpError):
+        return error.error.code == CONNECTION_CLOSED
+    return isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError))
+
+
+class AccountsSession:
+    """
+    A single accounts_server subprocess and MCP client session, shared by every caller on the event loop.
+
+    Callers hold a reference while they use it; the server is started by the first caller and
+    shut down once it has gone idle_seconds with no references. ClientSession tags each request
+    with its own id, so concurrent callers are multiplexed over the one stdio connection.
+    If the server dies, the session counts as closed as soon as its output ends: a request that
+    fails because the connection is gone starts a fresh server and is retried once, and later
+    requests start one before they are sent.
+    """
+
+    def __init__(self, server_params: StdioServerParameters, idle_seconds: float = ACCOUNTS_SESSION_IDLE_SECONDS):
+        self.server_params = server_params
+        self.idle_seconds = idle_seconds
+        self.session = None
+        self.references = 0
+        self.reconnects = 0
+        self._loop = None
+        self._lock = None
+        self._task = None
+        self._stop = None
+        self._idle_close = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # A new event loop (e.g. a second asyncio.run) can't reuse a session owned by the old one
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self.session = self._task = self._stop = self._idle_close = None
+            self.references = 0
+
+    def _is_open(self) -> bool:
+        return (
+            self.session is not None
+            and self._task is not None
+            and not self._task.done()
+            and not session_closed(self.session)
+        )
+
+    async def _serve(self, ready: asyncio.Future, stop: asyncio.Event):
+        try:
+            async with stdio_client(self.server_params) as streams:
+                async with mcp.ClientSession(*streams) as session:
+                    await session.initialize()
+                    ready.set_result(session)
+                    await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+
+    async def _open(self):
+        ready = self._loop.create_future()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._serve(ready, self._stop))
+        self.session = await ready
+
+    async def _close(self):
+        if self._stop:
+            self._stop.set()
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.session = self._task = self._stop = None
+
+    async def acquire(self) -> mcp.ClientSession:
+        self._bind_loop()
+        async with self._lock:
+            if self._idle_close:
+                self._idle_close.cancel()
+                self._idle_close = None
+            if not self._is_open():
+                await self._close()
+                await self._open()
+            self.references += 1
+            return self.session
+
+    def release(self):
+        self.references -= 1
+        if self.references == 0 and self._is_open():
+            self._idle_close = self._loop.call_later(
+                self.idle_seconds, lambda: asyncio.ensure_future(self._close_if_idle())
+            )
+
+    async def _close_if_idle(self):
+        async with self._lock:
+            if self.references == 0:
+                self._idle_close = None
+                await self._close()
+
+    async def reconnect(self, failed=None):
+        """Start a fresh server, unless another caller has already replaced the failed session"""
+        async with self._lock:
+            if failed is not None and self.session is not failed and self._is_open():
+                return
+            self.reconnects += 1
+            await self._close()
+            await self._open()
+
+    @asynccontextmanager
+    async def connect(self):
+        session = await self.acquire()
+        try:
+            yield session
+        finally:
+            self.release()
+
+    async def request(self, method: str, *args):
+        """Call a ClientSession method, reconnecting and retrying once if the server has gone away"""
+        async with self.connect() as session:
+            try:
+                return await getattr(session, method)(*args)
+            except Exception as e:
+                if self._is_open() and not connection_lost(e):
+                    raise
+                await self.reconnect(session)
+                return await getattr(self.session, method)(*args)
+
+    async def close(self):
+        """Shut the server down now, whether or not anyone still holds a reference"""
+        if self._lock:
+            async with self._lock:
+                if self._idle_close:
+                    self._idle_close.cancel()
+                    self._idle_close = None
+                await self._close()
+
+
+accounts_session = AccountsSession(params)
+
 
 async def list_accounts_tools():
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            tools_result = await session.list_tools()
-            return tools_result.tools
-        
+    tools_result = await accounts_session.request("list_tools")
+    return tools_result.tools
+
 async def call_accounts_tool(tool_name, tool_args):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.call_tool(tool_name, tool_args)
-            return result
-            
-async def read_accounts_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://accounts_server/{name}")
-            return result.contents[0].text
-        
+    return await accounts_session.request("call_tool", tool_name, tool_args)
+
+async def read_accounts_resource(name, view=None):
+    uri = f"accounts://accounts_server/{name}" if view is None else f"accounts://accounts_server/{name}/{view}"
+    result = await accounts_session.request("read_resource", uri)
+    return result.contents[0].text
+
 async def read_strategy_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://strategy/{name}")
-            return result.contents[0].text
+    result = await accounts_session.request("read_resource", f"accounts://strategy/{name}")
+    return result.contents[0].text
 
 async def get_accounts_tools_openai():
     openai_tools = []
@@ -44,7 +188,7 @@ async def get_accounts_tools_openai():
             description=tool.description,
             params_json_schema=schema,
             on_invoke_tool=lambda ctx, args, toolname=tool.name: call_accounts_tool(toolname, json.loads(args))
-                
+
         )
         openai_tools.append(openai_tool)
-    return openai_tools
\ No newline at end of file
+    return openai_tools
@@ -1,5 +1,5 @@
 from mcp.server.fastmcp import FastMCP
-from accounts import Account
+from accounts import Account, Order
 
 mcp = FastMCP("accounts_server")
 
@@ -21,6 +21,16 @@ async def get_holdings(name: str) -> dict[str, int]:
     """
     return Account.get(name).holdings
 
+@mcp.tool()
+async def get_unrealized_profit_loss(name: str) -> dict[str, dict[str, float]]:
+    """Get the unrealized profit or loss on each holding of the given account name,
+    with its quantity, average cost basis and current market value.
+
+    Args:
+        name: The name of the account holder
+    """
+    return Account.get(name).get_unrealized_profit_loss()
+
 @mcp.tool()
 async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
     """Buy shares of a stock.
@@ -46,6 +56,32 @@ async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) ->
     """
     return Account.get(name).sell_shares(symbol, quantity, rationale)
 
+@mcp.tool()
+async def execute_trades(name: str, orders: list[Order]) -> str:
+    """Buy and sell several stocks in one step. Sales are made first, so their proceeds can fund
+    the purchases. Either every order is filled or, if any can't be, none are.
+    Prefer this over repeated buy_shares and sell_shares calls when making more than one trade.
+
+    Args:
+        name: The name of the account holder
+        orders: The trades to make, each with the symbol, side ("buy" or "sell"), quantity of shares,
+            and the rationale for the trade and its fit with the account's strategy
+    """
+    return Account.get(name).execute_trades(orders)
+
+@mcp.tool()
+async def get_account_report(name: str, view: str = "holdings", transactions: int = 10) -> str:
+    """Get a report on the given account name, with its portfolio value and profit or loss.
+
+    Args:
+        name: The name of the account holder
+        view: How much to include: "summary" for just balance, value and profit or loss; "holdings" to add
+            holdings and cost basis; "recent" to also add the latest transactions; "full" for every transaction
+            and the portfolio value history
+        transactions: How many of the latest transactions to include in the "recent" view
+    """
+    return Account.get(name).report(view, transactions)
+
 @mcp.tool()
 async def change_strategy(name: str, strategy: str) -> str:
     """At your discretion, if you choose to, call this to change your investment strategy for the future.
@@ -61,6 +97,11 @@ async def read_account_resource(name: str) -> str:
     account = Account.get(name.lower())
     return account.report()
 
+@mcp.resource("accounts://accounts_server/{name}/{view}")
+async def read_account_view_resource(name: str, view: str) -> str:
+    account = Account.get(name.lower())
+    return account.report(view)
+
 @mcp.resource("accounts://strategy/{name}")
 async def read_strategy_resource(name: str) -> str:
     account = Account.get(name.lower())
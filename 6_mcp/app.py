@@ -1,10 +1,27 @@
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
 import gradio as gr
 from util import css, js, Color
 import pandas as pd
 from trading_floor import names, lastnames, short_model_names
 import plotly.express as px
 from accounts import Account
-from database import read_log
+from database import (
+    read_log_since,
+    read_account_version,
+    data_version,
+    read_slowest_spans,
+    read_span_latency,
+    read_portfolio_values,
+)
+
+LOG_LINES = 13
+PROFILING_HOURS = 24
+# How far back the portfolio value chart goes; 0 for the whole history
+PORTFOLIO_CHART_DAYS = float(os.getenv("PORTFOLIO_CHART_DAYS", "0"))
+SLOWEST_SPANS = 25
 
 mapper = {
     "trace": Color.WHITE,
@@ -22,9 +39,28 @@ class Trader:
         self.lastname = lastname
         self.model_name = model_name
         self.account = Account.get(name)
+        self.version = read_account_version(name)
+        self.seen_data_version = None
+        self.views = None
+        self.log_lines = deque(maxlen=LOG_LINES)
+        self.last_log_id = 0
+        self.logs_html = None
+        self.logs_data_version = None
+        self.lock = threading.Lock()
 
-    def reload(self):
-        self.account = Account.get(self.name)
+    def reload(self) -> bool:
+        """Reload the account only if something about it has changed; returns whether it did"""
+        with self.lock:
+            current = data_version()
+            if current == self.seen_data_version:
+                return False
+            self.seen_data_version = current
+            version = read_account_version(self.name)
+            if version == self.version:
+                return False
+            self.account = Account.get(self.name)
+            self.version = version
+            return True
 
     def get_title(self) -> str:
         return f"<div style='text-align: center;font-size:34px;'>{self.name}<span style='color:#ccc;font-size:24px;'> ({self.model_name}) - {self.lastname}</span></div>"
@@ -32,8 +68,9 @@ class Trader:
     def get_strategy(self) -> str:
         return self.account.get_strategy()
 
-    def get_portfolio_value_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(self.account.portfolio_value_time_series, columns=["datetime", "value"])
+    def get_portfolio_value_df(self, days: float = PORTFOLIO_CHART_DAYS) -> pd.DataFrame:
+        since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S") if days else ""
+        df = pd.DataFrame(read_portfolio_values(self.name, since), columns=["datetime", "value"])
         df["datetime"] = pd.to_datetime(df["datetime"])
         return df
 
@@ -80,14 +117,33 @@ class Trader:
         emoji = "⬆" if pnl >= 0 else "⬇"
         return f"<div style='text-align: center;background-color:{color};'><span style='font-size:32px'>${portfolio_value:,.0f}</span><span style='font-size:24px'>&nbsp;&nbsp;&nbsp;{emoji}&nbsp;${pnl:,.0f}</span></div>"
 
+    def get_account_views(self):
+        """The chart and tables for the current version of the account, built once per version"""
+        with self.lock:
+            if self.views is None or self.views[0] != self.version:
+                self.views = (
+                    self.version,
+                    self.get_portfolio_value_chart(),
+                    self.get_holdings_df(),
+                    self.get_transactions_df(),
+                )
+            return self.views
+
     def get_logs(self, previous=None) -> str:
-        logs = read_log(self.name, last_n=13)
-        response = ""
-        for log in logs:
-            timestamp, type, message = log
-            color = mapper.get(type, Color.WHITE).value
-            response += f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
-        response = f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
+        """
+        The latest log lines as HTML. Only entries newer than the last one seen are read, and the
+        database isn't queried at all unless something has been committed since the last call.
+        """
+        with self.lock:
+            current = data_version()
+            if current != self.logs_data_version:
+                self.logs_data_version = current
+                for id, timestamp, type, message in read_log_since(self.name, self.last_log_id, LOG_LINES):
+                    color = mapper.get(type, Color.WHITE).value
+                    self.log_lines.append(f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>")
+                    self.last_log_id = id
+                self.logs_html = f"<div style='height:250px; overflow-y:auto;'>{''.join(self.log_lines)}</div>"
+            response = self.logs_html
         if response != previous:
             return response
         return gr.update()
@@ -102,6 +158,7 @@ class TraderView:
         self.transactions_table = None
 
     def make_ui(self):
+        rendered_version = gr.State(None)
         with gr.Column():
             gr.HTML(self.trader.get_title())
             with gr.Row():
@@ -136,12 +193,13 @@ class TraderView:
         timer = gr.Timer(value=120)
         timer.tick(
             fn=self.refresh,
-            inputs=[],
+            inputs=[rendered_version],
             outputs=[
                 self.portfolio_value,
                 self.chart,
                 self.holdings_table,
                 self.transactions_table,
+                rendered_version,
             ],
             show_progress="hidden",
             queue=False,
@@ -155,14 +213,52 @@ class TraderView:
             queue=False,
         )
 
-    def refresh(self):
+    def refresh(self, rendered_version):
+        """
+        Re-price the portfolio value, but only rebuild the chart and tables in this browser tab
+        when the account has changed since the tab last drew them.
+        """
         self.trader.reload()
-        return (
-            self.trader.get_portfolio_value(),
-            self.trader.get_portfolio_value_chart(),
-            self.trader.get_holdings_df(),
-            self.trader.get_transactions_df(),
-        )
+        version, chart, holdings, transactions = self.trader.get_account_views()
+        if version == rendered_version:
+            return self.trader.get_portfolio_value(), gr.update(), gr.update(), gr.update(), rendered_version
+        return self.trader.get_portfolio_value(), chart, holdings, transactions, version
+
+
+class ProfilingView:
+    """Where trader runs spend their time: the slowest spans, and latency by tool, MCP server and model"""
+
+    span_headers = ["Started", "Trader", "Type", "Name", "Server", "Model", "ms", "Input tokens", "Output tokens", "Error"]
+    latency_headers = ["Calls", "p50 ms", "p95 ms", "Max ms", "Input tokens", "Output tokens"]
+    groups = {"tool": "Tool", "server": "MCP server", "model": "Model"}
+
+    def __init__(self):
+        self.seen_data_version = None
+        self.tables = None
+        self.lock = threading.Lock()
+
+    def get_tables(self) -> list[pd.DataFrame]:
+        """The profiling tables, re-queried only when something has been written since they were built"""
+        with self.lock:
+            current = data_version()
+            if self.tables is None or current != self.seen_data_version:
+                self.seen_data_version = current
+                since = (datetime.now(timezone.utc) - timedelta(hours=PROFILING_HOURS)).isoformat()
+                slowest = pd.DataFrame(read_slowest_spans(SLOWEST_SPANS, since), columns=self.span_headers)
+                self.tables = [slowest] + [
+                    pd.DataFrame(read_span_latency(group, since), columns=[label] + self.latency_headers)
+                    for group, label in self.groups.items()
+                ]
+            return self.tables
+
+    def make_ui(self):
+        tables = self.get_tables()
+        outputs = [gr.Dataframe(value=tables[0], label=f"Slowest spans, last {PROFILING_HOURS} hours", max_height=400)]
+        with gr.Row():
+            for (group, label), table in zip(self.groups.items(), tables[1:]):
+                outputs.append(gr.Dataframe(value=table, label=f"Latency by {label.lower()}", max_height=400))
+        timer = gr.Timer(value=30)
+        timer.tick(fn=self.get_tables, inputs=[], outputs=outputs, show_progress="hidden", queue=False)
 
 
 # Main UI construction
@@ -178,9 +274,13 @@ def create_ui():
     with gr.Blocks(
         title="Traders", css=css, js=js, theme=gr.themes.Default(primary_hue="sky"), fill_width=True
     ) as ui:
-        with gr.Row():
-            for trader_view in trader_views:
-                trader_view.make_ui()
+        with gr.Tabs():
+            with gr.Tab("Traders"):
+                with gr.Row():
+                    for trader_view in trader_views:
+                        trader_view.make_ui()
+            with gr.Tab("Profiling"):
+                ProfilingView().make_ui()
 
     return ui
 
@@ -0,0 +1,146 @@
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from accounts import INITIAL_BALANCE, SPREAD
+from database import read_prices
+from market import simulated_market
+
+
+class BacktestResult:
+    """
+    Cash, holdings and portfolio values for every account after a backtest.
+
+    values has one row per account and one column per tick, and portfolio_value_time_series()
+    gives an account's row in the same (datetime, value) form as Account.portfolio_value_time_series.
+    """
+
+    def __init__(self, timestamps, values, balance, holdings, trades, rejected, seconds):
+        self.timestamps = timestamps
+        self.values = values
+        self.balance = balance
+        self.holdings = holdings
+        self.trades = trades
+        self.rejected = rejected
+        self.seconds = seconds
+
+    def portfolio_value_time_series(self, account: int) -> list[tuple[str, float]]:
+        return list(zip(self.timestamps, self.values[account].tolist()))
+
+    def profit_loss(self, initial_balance: float = INITIAL_BALANCE) -> np.ndarray:
+        return self.values[:, -1] - initial_balance
+
+    def trades_per_second(self) -> float:
+        return self.trades / self.seconds if self.seconds else float("inf")
+
+
+def backtest(prices: np.ndarray, timestamps: list[str], strategy, accounts: int = 1,
+             initial_balance: float = INITIAL_BALANCE) -> BacktestResult:
+    """
+    Replay a price history against many accounts at once, with the same rules as Account.
+
+    prices has one row per symbol and one column per tick. At every tick strategy(tick, history,
+    holdings, balance) is given the prices so far and each account's holdings and cash, and returns
+    an (accounts, symbols) array of share quantities to trade: positive to buy, negative to sell.
+    As in Account, buys pay the SPREAD over the price and sells receive the SPREAD under it; a sale
+    of more shares than are held, or a buy that costs more than the cash left or is of a symbol with
+    no price, is rejected. Sales settle first, then buys in symbol order, so cash from a sale can
+    pay for a buy on the same tick.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    n_symbols, n_ticks = prices.shape
+    balance = np.full(accounts, float(initial_balance))
+    holdings = np.zeros((accounts, n_symbols), dtype=np.int64)
+    values = np.empty((accounts, n_ticks))
+    trades = rejected = 0
+    start = time.perf_counter()
+    for tick in range(n_ticks):
+        price = prices[:, tick]
+        orders = np.broadcast_to(np.asarray(strategy(tick, prices[:, : tick + 1], holdings, balance), dtype=np.int64),
+                                 (accounts, n_symbols))
+
+        selling = np.maximum(-orders, 0)
+        can_sell = (selling > 0) & (holdings >= selling)
+        sold = np.where(can_sell, selling, 0)
+        holdings -= sold
+        balance += sold @ (price * (1 - SPREAD))
+        trades += int(can_sell.sum())
+        rejected += int(((selling > 0) & ~can_sell).sum())
+
+        buying = np.maximum(orders, 0)
+        cost = buying * (price * (1 + SPREAD))
+        for symbol in np.flatnonzero(buying.any(axis=0)):
+            wanted = buying[:, symbol] > 0
+            can_buy = wanted & (cost[:, symbol] <= balance) & (price[symbol] > 0)
+            holdings[:, symbol] += np.where(can_buy, buying[:, symbol], 0)
+            balance -= np.where(can_buy, cost[:, symbol], 0.0)
+            trades += int(can_buy.sum())
+            rejected += int((wanted & ~can_buy).sum())
+
+        values[:, tick] = balance + holdings @ price
+    seconds = time.perf_counter() - start
+    return BacktestResult(timestamps, values, balance, holdings, trades, rejected, seconds)
+
+
+def simulated_prices(symbols: list[str], start: datetime, n_ticks: int, market=simulated_market):
+    """A price path per symbol from the simulator, with the timestamp of each tick"""
+    start_tick = market.tick(start.timestamp())
+    prices = market.paths(symbols, start_tick, n_ticks)
+    first = datetime.fromtimestamp(market.epoch + start_tick * market.tick_seconds)
+    step = timedelta(seconds=market.tick_seconds)
+    timestamps = [(first + step * i).strftime("%Y-%m-%d %H:%M:%S") for i in range(n_ticks)]
+    return prices, timestamps
+
+
+def historical_prices(symbols: list[str], dates: list[str]):
+    """
+    Prior close prices stored in the prices table for each date, with the timestamp of each date.
+    A symbol missing on a date keeps its last known price.
+    """
+    prices = np.zeros((len(symbols), len(dates)))
+    for column, date in enumerate(dates):
+        known = read_prices(date, symbols)
+        prices[:, column] = [known.get(symbol, 0.0) for symbol in symbols]
+    for column in range(1, len(dates)):
+        missing = prices[:, column] == 0
+        prices[missing, column] = prices[missing, column - 1]
+    return prices, [f"{date} 00:00:00" for date in dates]
+
+
+# Strategies: each returns a function of (tick, history, holdings, balance) for backtest()
+
+
+def buy_and_hold():
+    """Spend the starting cash evenly across every symbol on the first tick, then hold"""
+
+    def strategy(tick, history, holdings, balance):
+        if tick:
+            return 0
+        price = history[:, 0] * (1 + SPREAD)
+        budget = balance[:, None] / history.shape[0]
+        return np.floor_divide(budget, np.where(price > 0, price, np.inf)).astype(np.int64)
+
+    return strategy
+
+
+def momentum(lookback: int = 20, quantity: int = 10):
+    """Buy when a price rises above its moving average, and sell the whole position when it falls below"""
+
+    def strategy(tick, history, holdings, balance):
+        if tick < lookback:
+            return 0
+        price = history[:, -1]
+        average = history[:, -lookback - 1 : -1].mean(axis=1)
+        return np.where(price > average, quantity, np.where(price < average, -holdings, 0))
+
+    return strategy
+
+
+def random_trades(seed: int = 0, quantity: int = 5, probability: float = 0.05):
+    """Each account buys or sells each symbol at random, independently and reproducibly"""
+    rng = np.random.default_rng(seed)
+
+    def strategy(tick, history, holdings, balance):
+        draws = rng.random(holdings.shape)
+        return np.where(draws < probability / 2, quantity, np.where(draws < probability, -quantity, 0))
+
+    return strategy
@@ -0,0 +1,245 @@
+"""
+Micro-benchmarks for the trading floor's own overhead.
+
+Each benchmark runs against a throwaway database, so it is safe to run next to a live accounts.db:
+
+    uv run benchmarks.py            # run everything
+    uv run benchmarks.py database   # run a single benchmark
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+os.environ["ACCOUNTS_DB"] = os.path.join(tempfile.mkdtemp(prefix="bench_"), "accounts.db")
+
+import database  # noqa: E402  (must be imported after ACCOUNTS_DB is set)
+
+
+def report(label: str, ops: int, seconds: float) -> float:
+    rate = ops / seconds if seconds else float("inf")
+    print(f"{label:<48} {ops:>9,} ops in {seconds:7.3f}s  {rate:>12,.0f} ops/sec")
+    return rate
+
+
+def timed(label: str, ops: int, fn) -> float:
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    return report(label, ops, time.perf_counter() - start)
+
+
+# Connection-per-call versions of write_log / read_account, as database.py worked before pooling
+
+
+def unpooled_write_log(name: str, type: str, message: str):
+    with sqlite3.connect(database.DB) as conn:
+        conn.execute(database.WRITE_LOG_SQL, (name.lower(), type, message))
+        conn.commit()
+
+
+def unpooled_read_account(name: str):
+    with sqlite3.connect(database.DB) as conn:
+        return conn.execute(database.READ_ACCOUNT_SQL, (name.lower(),)).fetchone()
+
+
+def bench_database(ops: int = 2_000):
+    print("database: connection per call vs pooled WAL connection")
+    database.write_account("bench", {"name": "bench", "balance": 10_000.0})
+    database.close_connections()
+    with sqlite3.connect(database.DB) as conn:
+        conn.execute("PRAGMA journal_mode=DELETE")
+    before = timed("write_log (connect per call, rollback journal)", ops, lambda i: unpooled_write_log("bench", "bench", f"row {i}"))
+    before_read = timed("read_account (connect per call)", ops, lambda i: unpooled_read_account("bench"))
+    after = timed("write_log (pooled, WAL)", ops, lambda i: database.write_log("bench", "bench", f"row {i}"))
+    after_read = timed("read_account (pooled)", ops, lambda i: database.read_account("bench"))
+    print(f"write speedup x{after / before:.1f}, read speedup x{after_read / before_read:.1f}\n")
+
+
+def bench_log_sink(ops: int = 20_000):
+    from log_sink import LogSink
+
+    print("log_sink: time spent by the caller per log row")
+    timed("write_log (synchronous commit)", ops, lambda i: database.write_log("bench", "bench", f"row {i}"))
+    sink = LogSink(max_size=ops)
+    rate = timed("LogSink.write (queued)", ops, lambda i: sink.write("bench", "bench", f"row {i}"))
+    start = time.perf_counter()
+    sink.shutdown()
+    drain = time.perf_counter() - start
+    print(f"drained the rest in {drain:.3f}s; written {sink.written:,}, dropped {sink.dropped}, caller-side rate {rate:,.0f} rows/sec\n")
+
+
+def bench_logs(rows: int = 10_000_000, days: int = 100, queries: int = 200):
+    from datetime import datetime, timedelta, timezone
+
+    names = ["warren", "george", "ray", "cathie"]
+    types = ["trace", "agent", "function", "generation", "response", "account"]
+    now = datetime.now(timezone.utc)
+    first = now - timedelta(days=days)
+    step = (now - first) / rows
+    print(f"logs: {rows:,} rows over {days} days for {len(names)} traders")
+    conn = database.get_connection()
+    start = time.perf_counter()
+    chunk = 100_000
+    for offset in range(0, rows, chunk):
+        batch = [
+            (names[i % len(names)], (first + step * i).strftime("%Y-%m-%d %H:%M:%S"), types[i % len(types)], f"row {i}")
+            for i in range(offset, min(offset + chunk, rows))
+        ]
+        with conn:
+            conn.executemany(database.WRITE_LOGS_SQL, batch)
+    report("insert (executemany, 100k per transaction)", rows, time.perf_counter() - start)
+
+    timed("read_log last 13 (name, datetime index)", queries, lambda i: list(database.read_log(names[i % 4], 13)))
+    timed("read_log_since (keyset, nothing new)", queries, lambda i: database.read_log_since(names[i % 4], rows, 13))
+    pages, since_id = 0, 0
+    start = time.perf_counter()
+    while pages < queries and (page := database.read_log_page("ray", since_id, 100)):
+        since_id = page[-1][0]
+        pages += 1
+    report("read_log_page (100 rows per page)", pages, time.perf_counter() - start)
+
+    conn.execute("DROP INDEX logs_name_datetime")
+    timed("read_log last 13 (no index, full scan)", 3, lambda i: list(database.read_log(names[i % 4], 13)))
+    conn.execute("CREATE INDEX logs_name_datetime ON logs (name, datetime)")
+
+    start = time.perf_counter()
+    removed = database.compact_logs()
+    report(f"compact_logs ({database.LOG_RETENTION_DAYS:g} day retention, rows removed)", removed, time.perf_counter() - start)
+    left = conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+    summaries = conn.execute("SELECT COUNT(*) FROM log_summaries").fetchone()[0]
+    print(f"{left:,} rows left in logs, {summaries:,} rows in log_summaries\n")
+
+
+def bench_accounts_client(calls: int = 20):
+    import asyncio
+    import mcp
+    from mcp import StdioServerParameters
+    from mcp.client.stdio import stdio_client
+    from accounts_client import AccountsSession
+
+    server_params = StdioServerParameters(command=sys.executable, args=["accounts_server.py"], env=dict(os.environ))
+
+    async def spawn_per_call(name):
+        async with stdio_client(server_params) as streams:
+            async with mcp.ClientSession(*streams) as session:
+                await session.initialize()
+                return await session.read_resource(f"accounts://strategy/{name}")
+
+    async def run():
+        shared = AccountsSession(server_params)
+        start = time.perf_counter()
+        for _ in range(calls):
+            await spawn_per_call("bench")
+        before = report("read_strategy_resource (server per call)", calls, time.perf_counter() - start)
+        await shared.request("read_resource", "accounts://strategy/bench")  # one-off server start
+        start = time.perf_counter()
+        for _ in range(calls):
+            await shared.request("read_resource", "accounts://strategy/bench")
+        after = report("read_strategy_resource (shared session)", calls, time.perf_counter() - start)
+        start = time.perf_counter()
+        await asyncio.gather(*[shared.request("read_resource", "accounts://strategy/bench") for _ in range(calls)])
+        report("read_strategy_resource (shared, concurrent)", calls, time.perf_counter() - start)
+        await shared.close()
+        print(f"per-call latency {1000 / before:.1f}ms -> {1000 / after:.1f}ms\n")
+
+    print("accounts_client: MCP server per call vs one shared session")
+    asyncio.run(run())
+
+
+def bench_simulator(symbols: int = 1_000, ticks: int = 500):
+    from simulator import SimulatedMarket
+
+    market = SimulatedMarket()
+    names = [f"SYM{i}" for i in range(symbols)]
+    market.keys(names)
+    print("simulator: vectorized GBM prices")
+    timed("get_share_prices (1,000 symbols per call)", 100, lambda i: market.get_share_prices(names, when=i * 60.0))
+    start = time.perf_counter()
+    market.paths(names, 0, ticks)
+    report(f"paths ({symbols:,} symbols x {ticks} ticks)", symbols * ticks, time.perf_counter() - start)
+    print()
+
+
+def bench_backtest(accounts: int = 1_000, symbols: int = 50, ticks: int = 1_000):
+    import backtest
+    from datetime import datetime
+
+    prices, timestamps = backtest.simulated_prices([f"SYM{i}" for i in range(symbols)], datetime(2025, 1, 2), ticks)
+    print(f"backtest: {accounts:,} accounts x {symbols} symbols x {ticks:,} ticks")
+    for name, strategy in [("momentum", backtest.momentum()), ("random_trades", backtest.random_trades())]:
+        result = backtest.backtest(prices, timestamps, strategy, accounts=accounts)
+        report(f"{name} (simulated trades)", result.trades, result.seconds)
+    print()
+
+
+def bench_floor(traders: int = 100):
+    """
+    One tick of a floor of traders with every model call and MCP server except accounts_server
+    replayed from fixtures recorded with FIXTURES=record, so what's timed is the floor's own work:
+    scheduling, agent turns, MCP framing, accounts_server and the database. Traders take the
+    recorded traders' models in turn, and their tool calls carry the recorded arguments.
+    """
+    import asyncio
+
+    os.environ.setdefault("FIXTURES", "replay")
+    os.environ.setdefault("MARKET_BACKEND", "simulated")
+    for key in ("OPENAI_API_KEY", "OPENROUTER_API_KEY", "DEEPSEEK_API_KEY", "GOOGLE_API_KEY", "GROK_API_KEY"):
+        os.environ.setdefault(key, "replay")
+    from mcp import StdioServerParameters
+    from agents import set_trace_processors
+    import accounts_client
+    import fixtures
+    import mcp_params
+    from mcp_pool import MCPServerPool
+    from scheduler import Scheduler
+    from tracers import LogTracer
+    from traders import Trader, get_provider
+    from trading_floor import trader_specs
+
+    if not os.path.exists(os.path.join(fixtures.FIXTURES_DIR, fixtures.LLM_FIXTURES)):
+        print(f"floor: no fixtures in {fixtures.FIXTURES_DIR}; run the floor once with FIXTURES=record\n")
+        return
+    accounts = {"command": sys.executable, "args": ["accounts_server.py"], "env": dict(os.environ)}
+    mcp_params.trader_mcp_server_params[0] = accounts
+    accounts_client.accounts_session = accounts_client.AccountsSession(StdioServerParameters(**accounts))
+    set_trace_processors([LogTracer()])
+    specs = trader_specs()
+
+    async def run():
+        async with MCPServerPool() as pool:
+            floor = []
+            for i in range(traders):
+                name, lastname, model_name = specs[i % len(specs)]
+                floor.append(Trader(f"{name}{i}", lastname, model_name, mcp_pool=pool))
+            scheduler = Scheduler(floor, 3600, get_provider, jitter_seconds=0, max_concurrent=traders, runs_per_minute=1e9)
+            start = time.perf_counter()
+            scheduler.tick()
+            await scheduler.wait()
+            seconds = time.perf_counter() - start
+            await accounts_client.accounts_session.close()
+        durations = sorted(d for stats in scheduler.stats.values() for d in stats.durations)
+        report(f"trader runs ({traders} traders, replayed)", len(durations), seconds)
+        print(f"run p50 {durations[len(durations) // 2]:.2f}s, max {durations[-1]:.2f}s\n")
+
+    print(f"floor: one tick, latency x{fixtures.FIXTURE_LATENCY_SCALE} + {fixtures.FIXTURE_LATENCY_SECONDS}s")
+    asyncio.run(run())
+
+
+BENCHMARKS = {
+    "database": bench_database,
+    "log_sink": bench_log_sink,
+    "logs": bench_logs,
+    "accounts_client": bench_accounts_client,
+    "simulator": bench_simulator,
+    "backtest": bench_backtest,
+    "floor": bench_floor,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
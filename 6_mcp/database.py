@@ -1,16 +1,513 @@
 import sqlite3
 import json
-from datetime import datetime
+import os
+import atexit
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
-DB = "accounts.db"
+DB = os.getenv("ACCOUNTS_DB", "accounts.db")
 
+# Portfolio values are kept at full resolution for this many days, then one an hour until
+# PORTFOLIO_HOURLY_DAYS old, then one a day; thinned at most every PORTFOLIO_DOWNSAMPLE_SECONDS per account
+PORTFOLIO_FULL_RESOLUTION_DAYS = float(os.getenv("PORTFOLIO_FULL_RESOLUTION_DAYS", "1"))
+PORTFOLIO_HOURLY_DAYS = float(os.getenv("PORTFOLIO_HOURLY_DAYS", "30"))
+PORTFOLIO_DOWNSAMPLE_SECONDS = float(os.getenv("PORTFOLIO_DOWNSAMPLE_SECONDS", "3600"))
 
-with sqlite3.connect(DB) as conn:
+# Log rows older than this many days are rolled up into per-day counts in log_summaries; 0 keeps them forever
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "30"))
+
+# Each thread keeps one long-lived connection in WAL mode, so readers never block the writer
+# and a commit costs a WAL append rather than a full fsync of the database file.
+# The sqlite3 statement cache keeps the SQL below prepared on each connection.
+
+SYNCHRONOUS = os.getenv("ACCOUNTS_DB_SYNCHRONOUS", "NORMAL")
+BUSY_TIMEOUT_MS = 5000
+CACHED_STATEMENTS = 128
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0
+# Connections a forked child inherited from its parent, kept referenced so they are never closed
+_inherited = []
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return the calling thread's connection to the database, opening and tuning it on first use.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = sqlite3.connect(DB, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        _local.conn = conn
+        _local.generation = _generation
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+def close_connections() -> None:
+    """
+    Close every pooled connection; called automatically at interpreter exit.
+    Threads that touch the database afterwards transparently open a new connection.
+    """
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        while _connections:
+            conn = _connections.pop()
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+
+
+def _forget_connections() -> None:
+    """
+    In a forked child, set aside the connections inherited from the parent without closing them:
+    SQLite connections must not be used across fork, and closing them - or letting them be
+    garbage collected, which closes them too - could disturb the parent's locks. They are kept
+    in _inherited for the life of the child, which opens its own on first use.
+    """
+    global _generation, _connections, _connections_lock, _version_conn, _version_lock
+    _inherited.extend(_connections)
+    _generation += 1
+    _connections = []
+    _connections_lock = threading.Lock()
+    _version_conn = None
+    _version_lock = threading.Lock()
+
+
+atexit.register(close_connections)
+os.register_at_fork(after_in_child=_forget_connections)
+
+
+ACCOUNT_TABLES = [
+    '''
+        CREATE TABLE IF NOT EXISTS accounts (
+            name TEXT PRIMARY KEY,
+            balance REAL NOT NULL,
+            strategy TEXT NOT NULL DEFAULT '',
+            realized_pnl REAL NOT NULL DEFAULT 0,
+            total_invested REAL NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS holdings (
+            name TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            cost_basis REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, symbol)
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            price REAL NOT NULL,
+            timestamp TEXT NOT NULL,
+            rationale TEXT NOT NULL
+        )
+    ''',
+    'CREATE INDEX IF NOT EXISTS transactions_name_id ON transactions (name, id)',
+    '''
+        CREATE TABLE IF NOT EXISTS portfolio_values (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            datetime TEXT NOT NULL,
+            value REAL NOT NULL
+        )
+    ''',
+    'CREATE INDEX IF NOT EXISTS portfolio_values_name_id ON portfolio_values (name, id)',
+    'CREATE INDEX IF NOT EXISTS portfolio_values_name_datetime ON portfolio_values (name, datetime)',
+]
+
+
+def migrate_accounts_json(conn: sqlite3.Connection) -> int:
+    """
+    Convert an accounts table from the original layout, one JSON document per account,
+    into the normalized accounts/holdings/transactions/portfolio_values tables.
+    Runs in a single transaction and is a no-op once the database has been converted.
+
+    Returns:
+        int: The number of accounts migrated
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(accounts)")]
+    if "account" not in columns:
+        return 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("ALTER TABLE accounts RENAME TO accounts_json")
+        for statement in ACCOUNT_TABLES:
+            conn.execute(statement)
+        rows = conn.execute("SELECT name, account FROM accounts_json").fetchall()
+        for name, account_json in rows:
+            _replace_account(conn, name, json.loads(account_json))
+        conn.execute("DROP TABLE accounts_json")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(rows)
+
+
+def migrate_cost_basis(conn: sqlite3.Connection) -> int:
+    """
+    Add the running cost basis, realized P&L and total invested columns to a database that
+    predates them, and fill them in by replaying each account's transactions.
+
+    Returns:
+        int: The number of accounts backfilled
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(accounts)")]
+    if "total_invested" in columns:
+        return 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("ALTER TABLE accounts ADD COLUMN realized_pnl REAL NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE accounts ADD COLUMN total_invested REAL NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE holdings ADD COLUMN cost_basis REAL NOT NULL DEFAULT 0")
+        names = [row[0] for row in conn.execute("SELECT name FROM accounts")]
+        for name in names:
+            transactions = conn.execute(READ_TRANSACTIONS_SQL, (name,)).fetchall()
+            cost_basis, realized_pnl, total_invested = replay_cost_basis(
+                (symbol, quantity, price) for symbol, quantity, price, _, _ in transactions
+            )
+            conn.execute(
+                "UPDATE accounts SET realized_pnl = ?, total_invested = ? WHERE name = ?",
+                (realized_pnl, total_invested, name),
+            )
+            conn.executemany(
+                "UPDATE holdings SET cost_basis = ? WHERE name = ? AND symbol = ?",
+                [(cost, name, symbol) for symbol, cost in cost_basis.items()],
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(names)
+
+
+def migrate_account_version(conn: sqlite3.Connection) -> bool:
+    """
+    Add the version column, bumped by every write to an account, to a database that predates it.
+
+    Returns:
+        bool: Whether the column was added
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(accounts)")]
+    if "version" in columns:
+        return False
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("ALTER TABLE accounts ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def replay_cost_basis(transactions) -> tuple[dict[str, float], float, float]:
+    """
+    Rebuild the running aggregates from (symbol, quantity, price) trades, oldest first,
+    using average cost: a sale realizes (price - average cost) on each share sold.
+
+    Returns:
+        tuple: (cost basis per symbol held, realized P&L, total invested)
+    """
+    held, cost_basis = {}, {}
+    realized_pnl = total_invested = 0.0
+    for symbol, quantity, price in transactions:
+        total_invested += quantity * price
+        if quantity > 0:
+            held[symbol] = held.get(symbol, 0) + quantity
+            cost_basis[symbol] = cost_basis.get(symbol, 0.0) + quantity * price
+        elif held.get(symbol):
+            average_cost = cost_basis[symbol] / held[symbol]
+            realized_pnl += -quantity * (price - average_cost)
+            held[symbol] += quantity
+            if held[symbol]:
+                cost_basis[symbol] += quantity * average_cost
+            else:
+                del held[symbol], cost_basis[symbol]
+    return cost_basis, realized_pnl, total_invested
+
+
+def migrate_market_json(conn: sqlite3.Connection) -> int:
+    """
+    Move end-of-day prices out of the original market table, one JSON document per date,
+    into the prices table keyed by (symbol, date), then drop the old table.
+
+    Returns:
+        int: The number of dates migrated
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'market'").fetchone():
+        return 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute("SELECT date, data FROM market").fetchall()
+        for date, data in rows:
+            conn.executemany(WRITE_PRICE_SQL, [(symbol, date, price) for symbol, price in json.loads(data).items()])
+        conn.execute("DROP TABLE market")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(rows)
+
+
+class ConcurrentUpdateError(Exception):
+    """An account was written by someone else since it was read, so a write based on it was refused"""
+
+
+def _account_row(name: str, account_dict: dict) -> tuple:
+    return (
+        name.lower(),
+        account_dict.get("balance", 0.0),
+        account_dict.get("strategy", ""),
+        account_dict.get("realized_pnl", 0.0),
+        account_dict.get("total_invested", 0.0),
+    )
+
+
+def _replace_accounts(conn: sqlite3.Connection, accounts: dict[str, dict]) -> None:
+    """Replace everything stored for each name -> account dict, with one executemany per table"""
+    rows, holdings, transactions, portfolio_values = [], [], [], []
+    for name, account_dict in accounts.items():
+        name = name.lower()
+        cost_basis = account_dict.get("cost_basis")
+        if cost_basis is None:
+            # Accounts from before the running aggregates: derive them from the transaction history
+            cost_basis, realized_pnl, total_invested = replay_cost_basis(
+                (t["symbol"], t["quantity"], t["price"]) for t in account_dict.get("transactions", [])
+            )
+            account_dict = {**account_dict, "realized_pnl": realized_pnl, "total_invested": total_invested}
+        rows.append(_account_row(name, account_dict))
+        holdings.extend(
+            (name, symbol, quantity, cost_basis.get(symbol, 0.0))
+            for symbol, quantity in account_dict.get("holdings", {}).items()
+        )
+        transactions.extend(
+            (name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"])
+            for t in account_dict.get("transactions", [])
+        )
+        portfolio_values.extend(
+            (name, when, value) for when, value in account_dict.get("portfolio_value_time_series", [])
+        )
+    conn.executemany(WRITE_ACCOUNT_SQL, rows)
+    names = [(row[0],) for row in rows]
+    for table in ("holdings", "transactions", "portfolio_values"):
+        conn.executemany(f"DELETE FROM {table} WHERE name = ?", names)
+    conn.executemany(WRITE_HOLDING_SQL, holdings)
+    conn.executemany(WRITE_TRANSACTION_SQL, transactions)
+    conn.executemany(WRITE_PORTFOLIO_VALUE_SQL, portfolio_values)
+
+
+def _replace_account(conn: sqlite3.Connection, name: str, account_dict: dict) -> int:
+    _replace_accounts(conn, {name: account_dict})
+    return conn.execute("SELECT version FROM accounts WHERE name = ?", (name.lower(),)).fetchone()[0]
+
+
+def _update_account(conn: sqlite3.Connection, name: str, account_dict: dict) -> None:
+    """
+    Write an account's balance, strategy and aggregates, bumping its version - but only if the
+    version is still the one in account_dict, read before the change was made. Otherwise another
+    writer got there first, and ConcurrentUpdateError rolls back the whole transaction.
+    An account_dict without a version is written unconditionally.
+    """
+    if "version" not in account_dict:
+        conn.execute(WRITE_ACCOUNT_SQL, _account_row(name, account_dict))
+        return
+    name, balance, strategy, realized_pnl, total_invested = _account_row(name, account_dict)
+    cursor = conn.execute(
+        UPDATE_ACCOUNT_SQL, (balance, strategy, realized_pnl, total_invested, name, account_dict["version"])
+    )
+    if cursor.rowcount == 0:
+        raise ConcurrentUpdateError(f"Account {name} has changed since version {account_dict['version']} was read")
+
+
+WRITE_ACCOUNT_SQL = '''
+    INSERT INTO accounts (name, balance, strategy, realized_pnl, total_invested)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET
+        balance=excluded.balance,
+        strategy=excluded.strategy,
+        realized_pnl=excluded.realized_pnl,
+        total_invested=excluded.total_invested,
+        version=accounts.version + 1
+'''
+UPDATE_ACCOUNT_SQL = '''
+    UPDATE accounts
+    SET balance = ?, strategy = ?, realized_pnl = ?, total_invested = ?, version = version + 1
+    WHERE name = ? AND version = ?
+'''
+READ_ACCOUNT_SQL = 'SELECT balance, strategy, realized_pnl, total_invested, version FROM accounts WHERE name = ?'
+WRITE_HOLDING_SQL = '''
+    INSERT INTO holdings (name, symbol, quantity, cost_basis)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(name, symbol) DO UPDATE SET quantity=excluded.quantity, cost_basis=excluded.cost_basis
+'''
+DELETE_HOLDING_SQL = 'DELETE FROM holdings WHERE name = ? AND symbol = ?'
+READ_HOLDINGS_SQL = 'SELECT symbol, quantity, cost_basis FROM holdings WHERE name = ? ORDER BY rowid'
+WRITE_TRANSACTION_SQL = '''
+    INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+READ_TRANSACTIONS_SQL = '''
+    SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+    WHERE name = ?
+    ORDER BY id
+'''
+READ_RECENT_TRANSACTIONS_SQL = '''
+    SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+    WHERE name = ?
+    ORDER BY id DESC
+    LIMIT ?
+'''
+WRITE_PORTFOLIO_VALUE_SQL = 'INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)'
+READ_PORTFOLIO_VALUES_SQL = '''
+    SELECT datetime, value FROM portfolio_values
+    WHERE name = ? AND datetime >= ? AND datetime <= ?
+    ORDER BY datetime, id
+'''
+# Keep only the latest value in each bucket (strftime format) of the time range
+DOWNSAMPLE_PORTFOLIO_VALUES_SQL = '''
+    DELETE FROM portfolio_values
+    WHERE name = ? AND datetime >= ? AND datetime < ? AND id NOT IN (
+        SELECT MAX(id) FROM portfolio_values
+        WHERE name = ? AND datetime >= ? AND datetime < ?
+        GROUP BY strftime(?, datetime)
+    )
+'''
+READ_ACCOUNT_VERSION_SQL = '''
+    SELECT version, (SELECT MAX(id) FROM portfolio_values WHERE name = accounts.name)
+    FROM accounts WHERE name = ?
+'''
+
+
+WRITE_LOG_SQL = '''
+    INSERT INTO logs (name, datetime, type, message)
+    VALUES (?, datetime('now'), ?, ?)
+'''
+WRITE_LOGS_SQL = '''
+    INSERT INTO logs (name, datetime, type, message)
+    VALUES (?, ?, ?, ?)
+'''
+READ_LOG_SQL = '''
+    SELECT datetime, type, message FROM logs
+    WHERE name = ?
+    ORDER BY datetime DESC, id DESC
+    LIMIT ?
+'''
+READ_LOG_PAGE_SQL = '''
+    SELECT id, datetime, type, message FROM logs
+    WHERE name = ? AND id > ?
+    ORDER BY id
+    LIMIT ?
+'''
+READ_LOG_SINCE_SQL = '''
+    SELECT id, datetime, type, message FROM logs
+    WHERE name = ? AND id > ?
+    ORDER BY id DESC
+    LIMIT ?
+'''
+WRITE_SPANS_SQL = '''
+    INSERT OR REPLACE INTO spans (
+        span_id, trace_id, parent_id, trader, type, name, server, model,
+        started, ended, duration_ms, input_tokens, output_tokens, error
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+DELETE_SPANS_SQL = 'DELETE FROM spans WHERE rowid IN (SELECT rowid FROM spans WHERE started < ? LIMIT ?)'
+READ_SLOWEST_SPANS_SQL = '''
+    SELECT started, trader, type, name, server, model, duration_ms, input_tokens, output_tokens, error
+    FROM spans
+    WHERE duration_ms IS NOT NULL AND started >= ?
+    ORDER BY duration_ms DESC
+    LIMIT ?
+'''
+# Nearest-rank percentiles: the smallest duration whose rank within its group reaches p of the group
+READ_SPAN_LATENCY_SQL = '''
+    SELECT key, COUNT(*),
+        MIN(CASE WHEN rank >= 0.50 * n THEN duration_ms END),
+        MIN(CASE WHEN rank >= 0.95 * n THEN duration_ms END),
+        MAX(duration_ms),
+        SUM(input_tokens),
+        SUM(output_tokens)
+    FROM (
+        SELECT {key} AS key, duration_ms, input_tokens, output_tokens,
+            ROW_NUMBER() OVER (PARTITION BY {key} ORDER BY duration_ms) AS rank,
+            COUNT(*) OVER (PARTITION BY {key}) AS n
+        FROM spans
+        WHERE type IN ({types}) AND started >= ? AND {key} IS NOT NULL AND duration_ms IS NOT NULL
+    )
+    GROUP BY key
+    ORDER BY 4 DESC
+'''
+# What read_span_latency can group by: the span types to include and the column to group them on
+SPAN_GROUPS = {
+    "tool": (("function",), "name"),
+    "server": (("function", "mcp_tools"), "server"),
+    "model": (("generation", "response"), "model"),
+    "agent": (("agent",), "name"),
+}
+NEXT_LOG_NAME_SQL = 'SELECT MIN(name) FROM logs WHERE name > ?'
+OLDEST_LOG_SQL = 'SELECT MIN(datetime) FROM logs WHERE name = ?'
+SUMMARIZE_LOGS_SQL = '''
+    INSERT INTO log_summaries (name, date, type, entries, first, last)
+    SELECT name, date(datetime), type, COUNT(*), MIN(datetime), MAX(datetime) FROM logs
+    WHERE name = ? AND datetime >= ? AND datetime < ?
+    GROUP BY name, date(datetime), type
+    ON CONFLICT(name, date, type) DO UPDATE SET
+        entries=entries + excluded.entries,
+        first=MIN(first, excluded.first),
+        last=MAX(last, excluded.last)
+'''
+DELETE_LOGS_SQL = 'DELETE FROM logs WHERE name = ? AND datetime >= ? AND datetime < ?'
+READ_LOG_SUMMARIES_SQL = '''
+    SELECT date, type, entries, first, last FROM log_summaries
+    WHERE name = ?
+    ORDER BY date, type
+'''
+WRITE_PUSH_SQL = '''
+    INSERT INTO push_outbox (created, message)
+    VALUES (datetime('now'), ?)
+'''
+READ_DUE_PUSHES_SQL = '''
+    SELECT id, message, attempts FROM push_outbox
+    WHERE attempts < ? AND next_attempt <= ?
+    ORDER BY id
+    LIMIT ?
+'''
+LEASE_PUSH_SQL = 'UPDATE push_outbox SET next_attempt = ? WHERE id = ?'
+RETRY_PUSH_SQL = 'UPDATE push_outbox SET attempts = attempts + 1, next_attempt = ? WHERE id = ?'
+DELETE_PUSH_SQL = 'DELETE FROM push_outbox WHERE id = ?'
+DELETE_EXHAUSTED_PUSHES_SQL = 'DELETE FROM push_outbox WHERE attempts >= ?'
+READ_NEXT_PUSH_SQL = 'SELECT MIN(next_attempt) FROM push_outbox WHERE attempts < ?'
+WRITE_PRICE_SQL = '''
+    INSERT INTO prices (symbol, date, price)
+    VALUES (?, ?, ?)
+    ON CONFLICT(symbol, date) DO UPDATE SET price=excluded.price
+'''
+READ_MARKET_SQL = 'SELECT symbol, price FROM prices WHERE date = ?'
+HAS_MARKET_SQL = 'SELECT 1 FROM prices WHERE date = ? LIMIT 1'
+SQLITE_MAX_VARIABLES = 900
+
+
+with get_connection() as conn:
     cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -20,82 +517,444 @@ with sqlite3.connect(DB) as conn:
             message TEXT
         )
     ''')
-    cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
-    conn.commit()
-
-def write_account(name, account_dict):
-    json_data = json.dumps(account_dict)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO accounts (name, account)
-            VALUES (?, ?)
-            ON CONFLICT(name) DO UPDATE SET account=excluded.account
-        ''', (name.lower(), json_data))
-        conn.commit()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS prices (
+            symbol TEXT NOT NULL,
+            date TEXT NOT NULL,
+            price REAL NOT NULL,
+            PRIMARY KEY (symbol, date)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS prices_date ON prices (date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS logs_name_id ON logs (name, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS logs_name_datetime ON logs (name, datetime)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS log_summaries (
+            name TEXT NOT NULL,
+            date TEXT NOT NULL,
+            type TEXT NOT NULL,
+            entries INTEGER NOT NULL,
+            first DATETIME NOT NULL,
+            last DATETIME NOT NULL,
+            PRIMARY KEY (name, date, type)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS spans (
+            span_id TEXT PRIMARY KEY,
+            trace_id TEXT NOT NULL,
+            parent_id TEXT,
+            trader TEXT,
+            type TEXT NOT NULL,
+            name TEXT,
+            server TEXT,
+            model TEXT,
+            started DATETIME,
+            ended DATETIME,
+            duration_ms REAL,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            error TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS spans_trace_id ON spans (trace_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS spans_started ON spans (started)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS spans_duration ON spans (duration_ms)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS spans_type_started ON spans (type, started)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS push_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created DATETIME NOT NULL,
+            message TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL DEFAULT 0
+        )
+    ''')
+
+migrate_accounts_json(get_connection())
+migrate_market_json(get_connection())
+
+with get_connection() as conn:
+    for statement in ACCOUNT_TABLES:
+        conn.execute(statement)
+
+migrate_cost_basis(get_connection())
+migrate_account_version(get_connection())
+
+
+def write_account(name, account_dict) -> int:
+    """
+    Replace everything stored for an account - balance, strategy, holdings, transactions and
+    portfolio values - in one transaction. Used to create and reset accounts; day-to-day
+    updates go through the narrower writers below. Returns the account's new version.
+    """
+    with get_connection() as conn:
+        return _replace_account(conn, name, account_dict)
+
+def write_accounts(accounts: dict[str, dict]) -> int:
+    """
+    Replace everything stored for many accounts, given as name -> account dict in the form
+    write_account takes, in a single transaction. Returns how many accounts were written.
+    """
+    with get_connection() as conn:
+        _replace_accounts(conn, accounts)
+    return len(accounts)
+
+def snapshot_database(path: str) -> None:
+    """
+    Copy the whole database to path with SQLite's online backup, which gives a consistent copy
+    even while other processes are writing.
+    """
+    with sqlite3.connect(path) as target:
+        get_connection().backup(target)
+    target.close()
+
+def restore_database(path: str) -> None:
+    """
+    Replace the whole database with a snapshot taken by snapshot_database. The copy is made in
+    one transaction, so other connections see either the old database or the snapshot.
+    """
+    source = sqlite3.connect(path)
+    try:
+        source.backup(get_connection())
+    finally:
+        source.close()
+    _next_downsample.clear()
 
 def read_account(name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT account FROM accounts WHERE name = ?', (name.lower(),))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
-    
+    """
+    Read an account's balance, strategy, holdings and running P&L aggregates, or None if there
+    is no such account. The transaction history and portfolio values are read separately, on demand.
+    """
+    conn = get_connection()
+    row = conn.execute(READ_ACCOUNT_SQL, (name.lower(),)).fetchone()
+    if not row:
+        return None
+    holdings = conn.execute(READ_HOLDINGS_SQL, (name.lower(),)).fetchall()
+    balance, strategy, realized_pnl, total_invested, version = row
+    return {
+        "name": name.lower(),
+        "balance": balance,
+        "strategy": strategy,
+        "holdings": {symbol: quantity for symbol, quantity, _ in holdings},
+        "cost_basis": {symbol: cost_basis for symbol, _, cost_basis in holdings},
+        "realized_pnl": realized_pnl,
+        "total_invested": total_invested,
+        "version": version,
+    }
+
+def write_account_details(name: str, account_dict: dict) -> None:
+    """
+    Write an account's balance, strategy, holdings and aggregates, leaving its history untouched.
+    If account_dict has a version, the write is refused with ConcurrentUpdateError unless the
+    account is still at that version.
+    """
+    cost_basis = account_dict.get("cost_basis", {})
+    with get_connection() as conn:
+        _update_account(conn, name, account_dict)
+        conn.execute("DELETE FROM holdings WHERE name = ?", (name.lower(),))
+        conn.executemany(
+            WRITE_HOLDING_SQL,
+            [
+                (name.lower(), symbol, quantity, cost_basis.get(symbol, 0.0))
+                for symbol, quantity in account_dict["holdings"].items()
+            ],
+        )
+
+def write_trade(name: str, account_dict: dict, symbol: str, quantity: int, cost_basis: float, transaction: dict) -> None:
+    """
+    Record a trade as one transaction: the account's new balance and aggregates, the new quantity
+    and cost basis held of the symbol (a quantity of 0 removes the holding) and an appended row
+    in the transactions table. Refused with ConcurrentUpdateError, as in write_account_details,
+    if the account has moved on from account_dict's version.
+    """
+    with get_connection() as conn:
+        _update_account(conn, name, account_dict)
+        if quantity:
+            conn.execute(WRITE_HOLDING_SQL, (name.lower(), symbol, quantity, cost_basis))
+        else:
+            conn.execute(DELETE_HOLDING_SQL, (name.lower(), symbol))
+        conn.execute(
+            WRITE_TRANSACTION_SQL,
+            (
+                name.lower(),
+                transaction["symbol"],
+                transaction["quantity"],
+                transaction["price"],
+                transaction["timestamp"],
+                transaction["rationale"],
+            ),
+        )
+
+def write_trades(name: str, account_dict: dict, holdings: list[tuple[str, int, float]], transactions: list[dict]) -> None:
+    """
+    Record several trades as one transaction: the account's new balance and aggregates, the new
+    (symbol, quantity, cost basis) of every symbol traded (a quantity of 0 removes the holding)
+    and the appended rows in the transactions table. Refused with ConcurrentUpdateError, as in
+    write_account_details, if the account has moved on from account_dict's version.
+    """
+    name = name.lower()
+    with get_connection() as conn:
+        _update_account(conn, name, account_dict)
+        conn.executemany(
+            WRITE_HOLDING_SQL,
+            [(name, symbol, quantity, cost_basis) for symbol, quantity, cost_basis in holdings if quantity],
+        )
+        conn.executemany(DELETE_HOLDING_SQL, [(name, symbol) for symbol, quantity, _ in holdings if not quantity])
+        conn.executemany(
+            WRITE_TRANSACTION_SQL,
+            [(name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"]) for t in transactions],
+        )
+
+def read_transactions(name: str) -> list[dict]:
+    rows = get_connection().execute(READ_TRANSACTIONS_SQL, (name.lower(),)).fetchall()
+    return [
+        {"symbol": symbol, "quantity": quantity, "price": price, "timestamp": timestamp, "rationale": rationale}
+        for symbol, quantity, price, timestamp, rationale in rows
+    ]
+
+def read_recent_transactions(name: str, n: int) -> list[dict]:
+    """The n most recent transactions, oldest first, read backwards along the (name, id) index"""
+    rows = get_connection().execute(READ_RECENT_TRANSACTIONS_SQL, (name.lower(), n)).fetchall()
+    return [
+        {"symbol": symbol, "quantity": quantity, "price": price, "timestamp": timestamp, "rationale": rationale}
+        for symbol, quantity, price, timestamp, rationale in reversed(rows)
+    ]
+
+_next_downsample: dict[str, float] = {}
+
+def write_portfolio_value(name: str, when: str, value: float) -> None:
+    with get_connection() as conn:
+        conn.execute(WRITE_PORTFOLIO_VALUE_SQL, (name.lower(), when, value))
+    if time.monotonic() >= _next_downsample.get(name.lower(), 0.0):
+        _next_downsample[name.lower()] = time.monotonic() + PORTFOLIO_DOWNSAMPLE_SECONDS
+        downsample_portfolio_values(name)
+
+def downsample_portfolio_values(name: str, now: datetime | None = None) -> int:
+    """
+    Thin out an account's portfolio value history so it stays bounded: values from the last
+    PORTFOLIO_FULL_RESOLUTION_DAYS are all kept, older ones keep the last value of each hour,
+    and those older than PORTFOLIO_HOURLY_DAYS the last value of each day. Returns how many were removed.
+    """
+    now = now or datetime.now()
+    full = (now - timedelta(days=PORTFOLIO_FULL_RESOLUTION_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+    hourly = (now - timedelta(days=PORTFOLIO_HOURLY_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+    name = name.lower()
+    with get_connection() as conn:
+        removed = conn.execute(DOWNSAMPLE_PORTFOLIO_VALUES_SQL, (name, hourly, full, name, hourly, full, "%Y-%m-%d %H")).rowcount
+        removed += conn.execute(DOWNSAMPLE_PORTFOLIO_VALUES_SQL, (name, "", hourly, name, "", hourly, "%Y-%m-%d")).rowcount
+    return removed
+
+def read_portfolio_values(name: str, since: str = "", until: str = "9999") -> list[tuple[str, float]]:
+    """
+    An account's (datetime, value) history, optionally only from since and/or up to until,
+    both given as 'YYYY-MM-DD HH:MM:SS'.
+    """
+    return get_connection().execute(READ_PORTFOLIO_VALUES_SQL, (name.lower(), since, until)).fetchall()
+
 def write_log(name: str, type: str, message: str):
     """
     Write a log entry to the logs table.
-    
+
     Args:
         name (str): The name associated with the log
         type (str): The type of log entry
         message (str): The log message
     """
-    now = datetime.now().isoformat()
-    
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO logs (name, datetime, type, message)
-            VALUES (?, datetime('now'), ?, ?)
-        ''', (name.lower(), type, message))
-        conn.commit()
+    with get_connection() as conn:
+        conn.execute(WRITE_LOG_SQL, (name.lower(), type, message))
+
+def write_logs(entries: list[tuple[str, str, str, str]], spans: list[tuple] = ()) -> None:
+    """
+    Write a batch of log entries, and optionally span timings, in a single transaction.
+
+    Args:
+        entries (list): Tuples of (name, datetime, type, message), with datetime in UTC as 'YYYY-MM-DD HH:MM:SS'
+        spans (list): Rows for the spans table, in the column order of WRITE_SPANS_SQL
+    """
+    with get_connection() as conn:
+        conn.executemany(WRITE_LOGS_SQL, [(name.lower(), when, type, message) for name, when, type, message in entries])
+        if spans:
+            conn.executemany(WRITE_SPANS_SQL, spans)
 
 def read_log(name: str, last_n=10):
     """
     Read the most recent log entries for a given name.
-    
+
     Args:
         name (str): The name to retrieve logs for
         last_n (int): Number of most recent entries to retrieve
-        
+
     Returns:
         list: A list of tuples containing (datetime, type, message)
     """
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datetime, type, message FROM logs 
-            WHERE name = ? 
-            ORDER BY datetime DESC
-            LIMIT ?
-        ''', (name.lower(), last_n))
-        
-        return reversed(cursor.fetchall())
+    rows = get_connection().execute(READ_LOG_SQL, (name.lower(), last_n)).fetchall()
+    return reversed(rows)
 
-def write_market(date: str, data: dict) -> None:
-    data_json = json.dumps(data)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO market (date, data)
-            VALUES (?, ?)
-            ON CONFLICT(date) DO UPDATE SET data=excluded.data
-        ''', (date, data_json))
+def read_log_page(name: str, since_id: int = 0, limit=100):
+    """
+    Page through every log entry for a given name, oldest first. Pass the id of the last entry
+    of one page as since_id to get the next; each page is a single index range scan.
+
+    Returns:
+        list: A list of tuples containing (id, datetime, type, message)
+    """
+    return get_connection().execute(READ_LOG_PAGE_SQL, (name.lower(), since_id, limit)).fetchall()
+
+def read_log_since(name: str, since_id: int = 0, last_n=10):
+    """
+    Read the log entries for a given name written after the entry with id since_id.
+
+    Args:
+        name (str): The name to retrieve logs for
+        since_id (int): The id of the last entry already seen, or 0 for none
+        last_n (int): The most entries to return; if there are more new entries, only the latest are returned
+
+    Returns:
+        list: A list of tuples containing (id, datetime, type, message), oldest first
+    """
+    rows = get_connection().execute(READ_LOG_SINCE_SQL, (name.lower(), since_id, last_n)).fetchall()
+    return rows[::-1]
+
+def compact_logs(retention_days: float = LOG_RETENTION_DAYS, now: datetime | None = None) -> int:
+    """
+    Roll log entries older than retention_days up into per-day counts by name and type in
+    log_summaries, and delete them. Works through one name and day at a time, each in its own
+    short transaction, so writers are never held up for long. Returns how many entries were removed.
+    """
+    if retention_days <= 0:
+        return 0
+    now = now or datetime.now(timezone.utc)
+    cutoff = (now - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_connection()
+    removed = 0
+    name = ""
+    while (name := conn.execute(NEXT_LOG_NAME_SQL, (name,)).fetchone()[0]) is not None:
+        while (oldest := conn.execute(OLDEST_LOG_SQL, (name,)).fetchone()[0]) is not None and oldest < cutoff:
+            day_end = min((datetime.fromisoformat(oldest[:10]) + timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S"), cutoff)
+            with conn:
+                conn.execute(SUMMARIZE_LOGS_SQL, (name, oldest, day_end))
+                removed += conn.execute(DELETE_LOGS_SQL, (name, oldest, day_end)).rowcount
+    # Span timings past retention are simply dropped; percentiles can't be rolled up
+    span_cutoff = (now - timedelta(days=retention_days)).isoformat()
+    while True:
+        with conn:
+            deleted = conn.execute(DELETE_SPANS_SQL, (span_cutoff, 10_000)).rowcount
+        if not deleted:
+            return removed
+
+def read_log_summaries(name: str) -> list[tuple[str, str, int, str, str]]:
+    """Per-day (date, type, entries, first, last) counts of the log entries removed by compact_logs"""
+    return get_connection().execute(READ_LOG_SUMMARIES_SQL, (name.lower(),)).fetchall()
+
+def read_slowest_spans(limit: int = 20, since: str = "") -> list[tuple]:
+    """
+    The slowest spans started since the given ISO timestamp (default: all of them), slowest first, as
+    (started, trader, type, name, server, model, duration_ms, input_tokens, output_tokens, error)
+    """
+    return get_connection().execute(READ_SLOWEST_SPANS_SQL, (since, limit)).fetchall()
+
+def read_span_latency(group: str, since: str = "") -> list[tuple]:
+    """
+    Latency and token totals for spans started since the given ISO timestamp, grouped by tool,
+    MCP server, model or agent (see SPAN_GROUPS), as (key, calls, p50_ms, p95_ms, max_ms,
+    input_tokens, output_tokens) with the highest p95 first.
+    """
+    types, key = SPAN_GROUPS[group]
+    sql = READ_SPAN_LATENCY_SQL.format(key=key, types=", ".join("?" * len(types)))
+    return get_connection().execute(sql, (*types, since)).fetchall()
+
+def read_account_version(name: str):
+    """
+    A cheap fingerprint of an account - its version, bumped by every write to it, and its latest
+    portfolio value id - that changes whenever anything shown about the account changes.
+    None if there is no such account.
+    """
+    return get_connection().execute(READ_ACCOUNT_VERSION_SQL, (name.lower(),)).fetchone()
+
+_version_conn = None
+_version_generation = None
+_version_lock = threading.Lock()
+
+def data_version() -> int:
+    """
+    A number that changes every time another connection - in this process or any other - commits
+    to the database, read with PRAGMA data_version on a connection kept just for this. A reader
+    can skip its queries entirely while it stays the same.
+    """
+    global _version_conn, _version_generation
+    with _version_lock:
+        if _version_conn is None or _version_generation != _generation:
+            _version_conn = sqlite3.connect(DB, check_same_thread=False)
+            _version_generation = _generation
+            with _connections_lock:
+                _connections.append(_version_conn)
+        return _version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+def write_push(message: str) -> None:
+    """Add a push notification to the outbox, to be sent by a PushDispatcher"""
+    with get_connection() as conn:
+        conn.execute(WRITE_PUSH_SQL, (message,))
+
+def claim_pushes(now: float, lease_seconds: float, max_attempts: int, limit: int = 100) -> list[tuple[int, str, int]]:
+    """
+    Take the (id, message, attempts) of notifications due to be sent at time.time() now, oldest
+    first, and hold them for lease_seconds, so that a dispatcher in another process doesn't take
+    them too. Any that have already failed max_attempts times are deleted.
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(DELETE_EXHAUSTED_PUSHES_SQL, (max_attempts,))
+        rows = conn.execute(READ_DUE_PUSHES_SQL, (max_attempts, now, limit)).fetchall()
+        conn.executemany(LEASE_PUSH_SQL, [(now + lease_seconds, id) for id, _, _ in rows])
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows
+
+def next_push_due(max_attempts: int) -> float | None:
+    """
+    The time.time() at which the next notification in the outbox is due to be sent, or None if
+    there are none. A plain read, so a dispatcher can wait for it without taking the write lock.
+    """
+    return get_connection().execute(READ_NEXT_PUSH_SQL, (max_attempts,)).fetchone()[0]
+
+def delete_pushes(ids: list[int]) -> None:
+    with get_connection() as conn:
+        conn.executemany(DELETE_PUSH_SQL, [(id,) for id in ids])
+
+def retry_pushes(ids: list[int], next_attempt: float) -> None:
+    """Count a failed attempt at sending these notifications, and try again at next_attempt"""
+    with get_connection() as conn:
+        conn.executemany(RETRY_PUSH_SQL, [(next_attempt, id) for id in ids])
+
+def write_market(date: str, data: dict) -> None:
+    """
+    Store a day's closing prices, one row per symbol.
+    """
+    with get_connection() as conn:
+        conn.executemany(WRITE_PRICE_SQL, [(symbol, date, price) for symbol, price in data.items()])
 
 def read_market(date: str) -> dict | None:
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
\ No newline at end of file
+    rows = get_connection().execute(READ_MARKET_SQL, (date,)).fetchall()
+    return dict(rows) if rows else None
+
+def has_market(date: str) -> bool:
+    return get_connection().execute(HAS_MARKET_SQL, (date,)).fetchone() is not None
+
+def read_prices(date: str, symbols: list[str]) -> dict[str, float]:
+    """
+    Read the stored prices of just the given symbols on a date; symbols with no price are left out.
+    """
+    conn = get_connection()
+    prices = {}
+    for i in range(0, len(symbols), SQLITE_MAX_VARIABLES):
+        chunk = symbols[i : i + SQLITE_MAX_VARIABLES]
+        placeholders = ", ".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT symbol, price FROM prices WHERE date = ? AND symbol IN ({placeholders})", (date, *chunk)
+        )
+        prices.update(rows)
+    return prices
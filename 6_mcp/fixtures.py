@@ -0,0 +1,262 @@
+"""
+Record and replay of the trading floor's calls to model providers and MCP servers, so the floor
+can be run and load-tested offline.
+
+With FIXTURES=record every HTTP request a model client makes, and every tool list and tool call
+of an MCP server, is passed through to the real thing and its response appended to a file in
+FIXTURES_DIR, along with how long it took. With FIXTURES=replay nothing leaves the machine: each
+request is answered from those files after an injected delay of FIXTURE_LATENCY_SCALE times the
+recorded time plus FIXTURE_LATENCY_SECONDS. MCP servers whose command line contains one of
+FIXTURE_LIVE_SERVERS keep running for real, so the accounts database still sees every trade.
+
+A request is matched to a recording first by its exact content with every digit masked, so that
+times, prices and amounts don't matter, and failing that by its shape: the endpoint, model and
+number of messages for a model, or the tool name for an MCP server. When several recordings
+match, one is picked by a hash of the request, so the same request always gets the same response.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import httpx
+from agents.mcp import MCPServer, MCPServerStdio
+from mcp.types import CallToolResult, TextContent, Tool as MCPTool
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+FIXTURES = os.getenv("FIXTURES", "").strip().lower()
+FIXTURES_DIR = os.getenv("FIXTURES_DIR", "fixtures")
+FIXTURE_LATENCY_SCALE = float(os.getenv("FIXTURE_LATENCY_SCALE", "1"))
+FIXTURE_LATENCY_SECONDS = float(os.getenv("FIXTURE_LATENCY_SECONDS", "0"))
+FIXTURE_LIVE_SERVERS = [s for s in os.getenv("FIXTURE_LIVE_SERVERS", "accounts_server.py").split(",") if s]
+
+LLM_FIXTURES = "llm.jsonl"
+_KEPT_HEADERS = ("content-type",)
+
+_write_lock = threading.Lock()
+
+
+def _masked(text: str) -> str:
+    return re.sub(r"\d", "0", text)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _pick(candidates: list[dict], digest: str) -> dict:
+    return candidates[int(digest, 16) % len(candidates)]
+
+
+def _append(filename: str, record: dict) -> None:
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    line = json.dumps(record) + "\n"
+    with _write_lock, open(os.path.join(FIXTURES_DIR, filename), "a") as f:
+        f.write(line)
+
+
+def _load(filename: str) -> list[dict]:
+    path = os.path.join(FIXTURES_DIR, filename)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def _delay(seconds: float) -> None:
+    delay = seconds * FIXTURE_LATENCY_SCALE + FIXTURE_LATENCY_SECONDS
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+# Model providers: an httpx transport under each AsyncOpenAI client
+
+
+def _request_keys(request: httpx.Request) -> tuple[str, str]:
+    """The digest of a request's masked content, and of its shape"""
+    body = request.content.decode("utf-8", errors="replace")
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = {}
+    messages = data.get("messages") or data.get("input") or []
+    shape = f"{request.method} {request.url.host}{request.url.path} {data.get('model')} {len(messages)}"
+    return _digest(_masked(f"{request.method} {request.url.host}{request.url.path} {body}")), _digest(shape)
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Passes requests to the real transport and appends each response to the LLM fixtures"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        content = await response.aread()
+        await response.aclose()
+        key, shape = _request_keys(request)
+        headers = {name: value for name, value in response.headers.items() if name.lower() in _KEPT_HEADERS}
+        _append(LLM_FIXTURES, {
+            "key": key,
+            "shape": shape,
+            "status": response.status_code,
+            "headers": headers,
+            "body": content.decode("utf-8", errors="replace"),
+            "seconds": time.perf_counter() - start,
+        })
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Answers requests from the LLM fixtures; a request with no recording gets a 404"""
+
+    def __init__(self):
+        self.by_key: dict[str, list[dict]] = {}
+        self.by_shape: dict[str, list[dict]] = {}
+        for record in _load(LLM_FIXTURES):
+            self.by_key.setdefault(record["key"], []).append(record)
+            self.by_shape.setdefault(record["shape"], []).append(record)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key, shape = _request_keys(request)
+        candidates = self.by_key.get(key) or self.by_shape.get(shape)
+        if not candidates:
+            error = {"error": {"message": f"No recorded response for {request.url.path}", "type": "fixture_missing"}}
+            return httpx.Response(404, json=error, request=request)
+        record = _pick(candidates, key)
+        await _delay(record["seconds"])
+        return httpx.Response(record["status"], headers=record["headers"], content=record["body"].encode(), request=request)
+
+
+def http_transport(limits: httpx.Limits) -> httpx.AsyncBaseTransport | None:
+    """The transport for a model client in the current FIXTURES mode, or None for the default"""
+    if FIXTURES == "record":
+        return RecordingTransport(httpx.AsyncHTTPTransport(limits=limits))
+    if FIXTURES == "replay":
+        return ReplayTransport()
+    return None
+
+
+# MCP servers
+
+
+def server_fixtures(params: dict) -> str:
+    """The fixtures file for a server, named after its command line"""
+    command = " ".join([params.get("command", "")] + list(params.get("args", [])))
+    return "mcp_" + re.sub(r"[^A-Za-z0-9.-]+", "_", command).strip("_") + ".jsonl"
+
+
+def _call_keys(tool_name: str, arguments: dict | None) -> tuple[str, str]:
+    return _digest(_masked(f"{tool_name} {json.dumps(arguments or {}, sort_keys=True)}")), _digest(tool_name)
+
+
+class RecordingMCPServer(MCPServerStdio):
+    """A real stdio MCP server whose tool lists and tool calls are appended to its fixtures"""
+
+    def __init__(self, params: dict, **kwargs):
+        super().__init__(params, **kwargs)
+        self.fixtures = server_fixtures(params)
+        self.recorded_tools = False
+
+    async def list_tools(self) -> list[MCPTool]:
+        start = time.perf_counter()
+        tools = await super().list_tools()
+        if self.recorded_tools:
+            return tools
+        self.recorded_tools = True
+        _append(self.fixtures, {
+            "list_tools": [tool.model_dump(mode="json") for tool in tools],
+            "seconds": time.perf_counter() - start,
+        })
+        return tools
+
+    async def call_tool(self, tool_name: str, arguments: dict | None) -> CallToolResult:
+        start = time.perf_counter()
+        result = await super().call_tool(tool_name, arguments)
+        key, shape = _call_keys(tool_name, arguments)
+        _append(self.fixtures, {
+            "key": key,
+            "shape": shape,
+            "tool": tool_name,
+            "result": result.model_dump(mode="json"),
+            "seconds": time.perf_counter() - start,
+        })
+        return result
+
+
+class ReplayMCPServer(MCPServer):
+    """
+    Stands in for a stdio MCP server, answering from its fixtures without starting a process.
+    It answers pings like a live session, so MCPServerPool's health checks pass.
+    """
+
+    def __init__(self, params: dict, name: str | None = None, **kwargs):
+        self.params = params
+        self.fixtures = server_fixtures(params)
+        self._name = name or f"replay: {params.get('command', '')} {' '.join(params.get('args', []))}"
+        self.session = None
+        self.tools: list[MCPTool] = []
+        self.list_seconds = 0.0
+        self.by_key: dict[str, list[dict]] = {}
+        self.by_shape: dict[str, list[dict]] = {}
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    async def connect(self):
+        for record in _load(self.fixtures):
+            if "list_tools" in record:
+                self.tools = [MCPTool.model_validate(tool) for tool in record["list_tools"]]
+                self.list_seconds = record["seconds"]
+            else:
+                self.by_key.setdefault(record["key"], []).append(record)
+                self.by_shape.setdefault(record["shape"], []).append(record)
+        self.session = self
+
+    async def send_ping(self):
+        return None
+
+    async def cleanup(self):
+        self.session = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.cleanup()
+
+    async def list_tools(self) -> list[MCPTool]:
+        await _delay(self.list_seconds)
+        return self.tools
+
+    async def call_tool(self, tool_name: str, arguments: dict | None) -> CallToolResult:
+        key, shape = _call_keys(tool_name, arguments)
+        candidates = self.by_key.get(key) or self.by_shape.get(shape)
+        if not candidates:
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"No recorded result for {tool_name}")], isError=True
+            )
+        record = _pick(candidates, key)
+        await _delay(record["seconds"])
+        return CallToolResult.model_validate(record["result"])
+
+
+def mcp_server(params: dict, **kwargs) -> MCPServer:
+    """An MCP server for params in the current FIXTURES mode, taking MCPServerStdio's arguments"""
+    command = " ".join([params.get("command", "")] + list(params.get("args", [])))
+    if FIXTURES == "record":
+        return RecordingMCPServer(params, **kwargs)
+    if FIXTURES == "replay" and not any(live in command for live in FIXTURE_LIVE_SERVERS):
+        return ReplayMCPServer(params, **kwargs)
+    return MCPServerStdio(params, **kwargs)
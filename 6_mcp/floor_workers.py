@@ -0,0 +1,216 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+from dotenv import load_dotenv
+from agents import add_trace_processor
+from mcp_pool import MCPServerPool
+from scheduler import (
+    Scheduler,
+    every,
+    MAX_CONCURRENT_RUNS_PER_PROVIDER,
+    RUNS_PER_MINUTE_PER_PROVIDER,
+)
+from tracers import LogTracer
+from traders import Trader, get_provider
+
+load_dotenv(override=True)
+
+# How long the coordinator waits for each worker to report back after a tick
+WORKER_REPLY_SECONDS = float(os.getenv("WORKER_REPLY_SECONDS", "60"))
+
+
+def shard(specs: list, workers: int, max_concurrent: int = MAX_CONCURRENT_RUNS_PER_PROVIDER) -> list[list]:
+    """
+    Deal trader specs into at most `workers` non-empty shards. Each provider's traders are dealt
+    round-robin across no more shards than it may run traders at once, the least loaded first,
+    so that every shard holding one of them can be given at least one of its slots.
+    """
+    shards = [[] for _ in range(workers)]
+    by_provider: dict[str, list] = {}
+    for spec in specs:
+        by_provider.setdefault(get_provider(spec[2]), []).append(spec)
+    for group in by_provider.values():
+        spread = max(1, min(workers, max_concurrent, len(group)))
+        targets = sorted(range(workers), key=lambda index: (len(shards[index]), index))[:spread]
+        for i, spec in enumerate(group):
+            shards[targets[i % spread]].append(spec)
+    return [specs for specs in shards if specs]
+
+
+def shard_limits(
+    shards: list[list],
+    max_concurrent: int = MAX_CONCURRENT_RUNS_PER_PROVIDER,
+    runs_per_minute: float = RUNS_PER_MINUTE_PER_PROVIDER,
+) -> list[dict[str, tuple[int, float]]]:
+    """
+    Split each provider's limits between the shards holding its traders, in proportion to how
+    many each holds: each gets at least one concurrent run, the slots add up to max_concurrent,
+    and runs_per_minute is shared in the same proportion, so the workers together stay within
+    both. A provider with more shards than slots (only if shard() didn't deal them) gets one each.
+    """
+    counts = [{} for _ in shards]
+    for index, specs in enumerate(shards):
+        for _, _, model_name in specs:
+            provider = get_provider(model_name)
+            counts[index][provider] = counts[index].get(provider, 0) + 1
+    limits = [{} for _ in shards]
+    for provider in {provider for shard_counts in counts for provider in shard_counts}:
+        holding = {index: shard_counts[provider] for index, shard_counts in enumerate(counts) if provider in shard_counts}
+        slots = {index: 1 for index in holding}
+        spare = max_concurrent - len(holding)
+        if spare > 0:
+            total = sum(holding.values())
+            shares = {index: spare * count / total for index, count in holding.items()}
+            for index in holding:
+                slots[index] += int(shares[index])
+            # Hand out what rounding down left over, largest remainder first
+            left = spare - sum(int(share) for share in shares.values())
+            for index in sorted(holding, key=lambda index: (int(shares[index]) - shares[index], index))[:left]:
+                slots[index] += 1
+        total_slots = sum(slots.values())
+        for index, shard_slots in slots.items():
+            limits[index][provider] = (shard_slots, runs_per_minute * shard_slots / total_slots)
+    return limits
+
+
+async def serve_shard(index: int, specs, period_seconds: float, limits, commands, replies):
+    """
+    A worker's event loop: it owns the traders in its shard, their MCP servers and a Scheduler,
+    and runs them whenever the coordinator says to tick, within the shard's share of each
+    provider's limits from shard_limits().
+    """
+    add_trace_processor(LogTracer())
+    async with MCPServerPool() as mcp_pool:
+        traders = [Trader(name, lastname, model_name, mcp_pool=mcp_pool) for name, lastname, model_name in specs]
+        scheduler = Scheduler(traders, period_seconds, get_provider, limits=limits)
+        while True:
+            number, command = await asyncio.to_thread(commands.get)
+            if command == "tick":
+                await mcp_pool.check_health()
+                scheduler.tick()
+            elif command == "stop":
+                await scheduler.wait()
+            replies.put((number, index, scheduler.running_count(), scheduler.metrics()))
+            if command == "stop":
+                return
+
+
+def run_worker(index: int, specs, period_seconds: float, limits, commands, replies):
+    asyncio.run(serve_shard(index, specs, period_seconds, limits, commands, replies))
+
+
+class ShardedFloor:
+    """
+    Runs the traders across a pool of worker processes, so that serialization, validation and
+    MCP framing for hundreds of traders aren't all bound to one core.
+
+    Trader specs (name, lastname, model_name) are dealt to the workers by shard(), and each
+    provider's limits split between them by shard_limits(), so the workers together run no more
+    of a provider's traders at once, nor start them any faster, than one process would. The
+    coordinator, in the parent process, owns the clock and the market-open check; each tick it
+    tells every worker to run its traders and collects back how many are running and their run
+    metrics.
+    A worker that has died is restarted with the same shard. Workers are started with spawn, so
+    none inherits the parent's SQLite connections, event loop or threads.
+
+    Every command is numbered, and each reply carries the number of the command it answers, so a
+    reply that arrives after collect has given up on it is dropped rather than taken for the next.
+    """
+
+    def __init__(self, specs, workers: int, period_seconds: float):
+        self.shards = shard(specs, workers)
+        self.limits = shard_limits(self.shards)
+        self.period_seconds = period_seconds
+        self.context = multiprocessing.get_context("spawn")
+        self.replies = self.context.Queue()
+        self.commands = [self.context.Queue() for _ in self.shards]
+        self.processes: list = [None] * len(self.shards)
+        self.status: dict[int, tuple[int, dict]] = {}
+        self.number = 0
+        self.restarts = 0
+
+    def start_worker(self, index: int):
+        self.processes[index] = self.context.Process(
+            target=run_worker,
+            args=(index, self.shards[index], self.period_seconds, self.limits[index], self.commands[index], self.replies),
+            name=f"trading-floor-{index}",
+            daemon=True,
+        )
+        self.processes[index].start()
+
+    def start(self):
+        for index in range(len(self.shards)):
+            self.start_worker(index)
+
+    def send(self, command: str, indexes=None):
+        """Send a command to every worker (or those given), restarting any that have died"""
+        self.number += 1
+        for index in range(len(self.shards)) if indexes is None else indexes:
+            if not self.processes[index].is_alive():
+                print(f"Restarting trading floor worker {index}")
+                self.restarts += 1
+                self.start_worker(index)
+            self.commands[index].put((self.number, command))
+
+    async def collect(self, indexes=None, timeout: float = WORKER_REPLY_SECONDS):
+        """
+        Wait for a reply to the last command from every worker (or those given), up to timeout
+        seconds in all. Late replies to earlier commands are dropped.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        pending = set(range(len(self.shards)) if indexes is None else indexes)
+        while pending:
+            try:
+                number, index, running, metrics = await asyncio.to_thread(
+                    self.replies.get, timeout=max(0.0, deadline - loop.time())
+                )
+            except queue.Empty:
+                print(f"No status from trading floor workers {sorted(pending)}")
+                return
+            if number != self.number:
+                continue
+            self.status[index] = (running, metrics)
+            pending.discard(index)
+
+    def summary(self) -> dict:
+        """Run metrics for every trader, with floor-wide totals"""
+        traders = {name: stats for _, metrics in self.status.values() for name, stats in metrics.items()}
+        return {
+            "workers": len(self.shards),
+            "restarts": self.restarts,
+            "running": sum(running for running, _ in self.status.values()),
+            "runs": sum(stats["runs"] for stats in traders.values()),
+            "skipped": sum(stats["skipped"] for stats in traders.values()),
+            "traders": traders,
+        }
+
+    async def tick(self, should_run):
+        if await asyncio.to_thread(should_run):
+            self.send("tick")
+            await self.collect()
+            summary = self.summary()
+            print(
+                f"Tick sent to {summary['workers']} workers: {summary['running']} traders running, "
+                f"{summary['runs']} runs completed, {summary['skipped']} skipped"
+            )
+        else:
+            print("Market is closed, skipping run")
+
+    async def run(self, should_run, ticks: int | None = None):
+        self.start()
+        try:
+            await every(self.period_seconds, lambda: self.tick(should_run), ticks)
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        stopping = [index for index, process in enumerate(self.processes) if process and process.is_alive()]
+        self.send("stop", stopping)
+        await self.collect(stopping)
+        for process in self.processes:
+            if process:
+                await asyncio.to_thread(process.join, 10)
+                if process.is_alive():
+                    process.terminate()
@@ -0,0 +1,124 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from database import write_logs, compact_logs
+
+load_dotenv(override=True)
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "0.5"))
+LOG_BLOCK_SECONDS = float(os.getenv("LOG_BLOCK_SECONDS", "0"))
+LOG_COMPACT_SECONDS = float(os.getenv("LOG_COMPACT_SECONDS", "3600"))
+
+_FLUSH = object()
+_STOP = object()
+
+
+class _Span(tuple):
+    """A spans table row on the queue, told apart from log rows by its type"""
+
+
+class LogSink:
+    """
+    Collects log rows, and span timing rows, on a bounded queue and writes them from a
+    background thread, so callers on the agent's event loop never wait on a SQLite commit.
+
+    Rows are flushed with one executemany when batch_size rows are waiting or flush_seconds
+    have passed since the first one arrived. When the queue is full, write() blocks for up to
+    block_seconds (0 means not at all) and then drops the row, counting it in `dropped`.
+    Every compact_seconds the thread also rolls up entries past the retention period (see compact_logs).
+    """
+
+    def __init__(
+        self,
+        max_size: int = LOG_QUEUE_SIZE,
+        batch_size: int = LOG_BATCH_SIZE,
+        flush_seconds: float = LOG_FLUSH_SECONDS,
+        block_seconds: float = LOG_BLOCK_SECONDS,
+        compact_seconds: float = LOG_COMPACT_SECONDS,
+    ):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.block_seconds = block_seconds
+        self.compact_seconds = compact_seconds
+        self.compacted = 0
+        self._next_compaction = time.monotonic()
+        self.dropped = 0
+        self.written = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+
+    def write(self, name: str, type: str, message: str) -> bool:
+        """Queue a log row, returning False if it had to be dropped"""
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            if self.block_seconds > 0:
+                self.queue.put((name, now, type, message), timeout=self.block_seconds)
+            else:
+                self.queue.put_nowait((name, now, type, message))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def write_span(self, row: tuple) -> bool:
+        """Queue a row for the spans table, returning False if it had to be dropped"""
+        try:
+            self.queue.put_nowait(_Span(row))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def flush(self) -> None:
+        """Block until every row queued so far has been written"""
+        if self._thread.is_alive():
+            self.queue.put(_FLUSH)
+            self.queue.join()
+
+    def shutdown(self) -> None:
+        """Drain the queue and stop the background thread"""
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while batch[-1] not in (_FLUSH, _STOP) and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is _STOP
+            rows = [row for row in batch if type(row) is tuple]
+            spans = [row for row in batch if type(row) is _Span]
+            try:
+                if rows or spans:
+                    write_logs(rows, spans)
+                    self.written += len(rows) + len(spans)
+            except Exception as e:
+                print(f"Failed to write {len(rows)} log entries: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if stopping:
+                return
+            if self.compact_seconds > 0 and time.monotonic() >= self._next_compaction:
+                self._next_compaction = time.monotonic() + self.compact_seconds
+                try:
+                    self.compacted += compact_logs()
+                except Exception as e:
+                    print(f"Failed to compact logs: {e}")
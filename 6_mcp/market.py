@@ -2,10 +2,13 @@ from polygon import RESTClient
 from dotenv import load_dotenv
 import os
 from datetime import datetime
-import random
-from database import write_market, read_market
-from functools import lru_cache
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from database import write_market, has_market, read_prices
 from datetime import timezone
+from simulator import SimulatedMarket
 
 load_dotenv(override=True)
 
@@ -15,8 +18,92 @@ polygon_plan = os.getenv("POLYGON_PLAN")
 is_paid_polygon = polygon_plan == "paid"
 is_realtime_polygon = polygon_plan == "realtime"
 
-
-def is_market_open() -> bool:
+# How long a price stays fresh: end of day prices only change once a day, the paid plan is
+# 15 minutes delayed, and realtime prices go stale quickly
+
+if is_realtime_polygon:
+    default_price_cache_seconds = 5
+elif is_paid_polygon:
+    default_price_cache_seconds = 60
+else:
+    default_price_cache_seconds = 3600
+
+PRICE_CACHE_SECONDS = float(os.getenv("PRICE_CACHE_SECONDS", default_price_cache_seconds))
+PRICE_CACHE_SIZE = int(os.getenv("PRICE_CACHE_SIZE", "20000"))
+
+# Where prices come from: "polygon", or "simulated" for deterministic offline prices
+MARKET_BACKEND = os.getenv("MARKET_BACKEND", "polygon" if polygon_api_key else "simulated")
+
+
+class PriceCache:
+    """
+    In-process LRU of symbol -> price, where each entry expires after ttl seconds.
+
+    Misses are passed to fetch() as one batch. Symbols already being fetched by another
+    thread are not fetched again; the caller waits for that fetch and shares its result.
+    """
+
+    def __init__(self, fetch, ttl: float = PRICE_CACHE_SECONDS, max_size: int = PRICE_CACHE_SIZE):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._prices: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._in_flight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, symbols) -> dict[str, float]:
+        now = time.monotonic()
+        prices, waiting, mine = {}, {}, []
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                cached = self._prices.get(symbol)
+                if cached and now - cached[1] < self.ttl:
+                    self._prices.move_to_end(symbol)
+                    prices[symbol] = cached[0]
+                    self.hits += 1
+                elif symbol in self._in_flight:
+                    waiting[symbol] = self._in_flight[symbol]
+                else:
+                    mine.append(symbol)
+                    self._in_flight[symbol] = Future()
+                    self.misses += 1
+        if mine:
+            try:
+                fetched = self.fetch(mine)
+            except Exception as e:
+                with self._lock:
+                    for symbol in mine:
+                        self._in_flight.pop(symbol).set_exception(e)
+                raise
+            with self._lock:
+                try:
+                    for symbol in mine:
+                        # A symbol the fetch has no price for is 0.0, as in the end of day data
+                        price = fetched.get(symbol, 0.0)
+                        self._prices[symbol] = (price, now)
+                        self._prices.move_to_end(symbol)
+                        self._in_flight.pop(symbol).set_result(price)
+                        prices[symbol] = price
+                    while len(self._prices) > self.max_size:
+                        self._prices.popitem(last=False)
+                finally:
+                    # Never leave a waiter blocked on a Future that nobody will resolve
+                    for symbol in mine:
+                        future = self._in_flight.pop(symbol, None)
+                        if future is not None:
+                            future.set_exception(RuntimeError(f"Failed to price {symbol}"))
+        for symbol, future in waiting.items():
+            prices[symbol] = future.result()
+        return prices
+
+    def clear(self):
+        with self._lock:
+            self._prices.clear()
+
+
+def is_market_open_polygon() -> bool:
     client = RESTClient(polygon_api_key)
     market_status = client.get_market_status()
     return market_status.market == "open"
@@ -33,19 +120,31 @@ def get_all_share_prices_polygon_eod() -> dict[str, float]:
     return {result.ticker: result.close for result in results}
 
 
-@lru_cache(maxsize=2)
-def get_market_for_prior_date(today):
-    market_data = read_market(today)
-    if not market_data:
-        market_data = get_all_share_prices_polygon_eod()
-        write_market(today, market_data)
-    return market_data
+_market_load_lock = threading.Lock()
 
 
-def get_share_price_polygon_eod(symbol) -> float:
+def get_market_for_prior_date(today, symbols) -> dict[str, float]:
+    """
+    Prior close prices of the given symbols, from the prices table. The whole market for the
+    date is fetched and stored the first time it is needed, by one thread at a time.
+    """
+    prices = read_prices(today, symbols)
+    if not prices and not has_market(today):
+        with _market_load_lock:
+            if not has_market(today):
+                write_market(today, get_all_share_prices_polygon_eod())
+        prices = read_prices(today, symbols)
+    return prices
+
+
+def get_share_prices_polygon_eod(symbols: list[str]) -> dict[str, float]:
     today = datetime.now().date().strftime("%Y-%m-%d")
-    market_data = get_market_for_prior_date(today)
-    return market_data.get(symbol, 0.0)
+    market_data = get_market_for_prior_date(today, symbols)
+    return {symbol: market_data.get(symbol, 0.0) for symbol in symbols}
+
+
+def get_share_price_polygon_eod(symbol) -> float:
+    return get_share_prices_polygon_eod([symbol])[symbol]
 
 
 def get_share_price_polygon_min(symbol) -> float:
@@ -54,6 +153,12 @@ def get_share_price_polygon_min(symbol) -> float:
     return result.min.close or result.prev_day.close
 
 
+def get_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    client = RESTClient(polygon_api_key)
+    results = client.get_snapshot_all("stocks", tickers=symbols)
+    return {result.ticker: result.min.close or result.prev_day.close for result in results}
+
+
 def get_share_price_polygon(symbol) -> float:
     if is_paid_polygon:
         return get_share_price_polygon_min(symbol)
@@ -61,10 +166,71 @@ def get_share_price_polygon(symbol) -> float:
         return get_share_price_polygon_eod(symbol)
 
 
-def get_share_price(symbol) -> float:
-    if polygon_api_key:
+def get_share_prices_polygon(symbols: list[str]) -> dict[str, float]:
+    if is_paid_polygon:
+        prices = get_share_prices_polygon_min(symbols)
+        # Symbols missing from the snapshot take the single-symbol path, as they always have
+        for symbol in symbols:
+            if symbol not in prices:
+                prices[symbol] = fetch_share_price(symbol)
+        return prices
+    else:
+        return get_share_prices_polygon_eod(symbols)
+
+
+simulated_market = SimulatedMarket()
+
+
+class PolygonMarket:
+    """Prices from Polygon, falling back to the simulator when the API can't be reached"""
+
+    def get_share_prices(self, symbols: list[str]) -> dict[str, float]:
         try:
-            return get_share_price_polygon(symbol)
+            if len(symbols) == 1:
+                return {symbols[0]: get_share_price_polygon(symbols[0])}
+            return get_share_prices_polygon(symbols)
         except Exception as e:
-            print(f"Was not able to use the polygon API due to {e}; using a random number")
-    return float(random.randint(1, 100))
+            print(f"Was not able to use the polygon API due to {e}; using simulated prices")
+            return simulated_market.get_share_prices(symbols)
+
+    def is_market_open(self) -> bool:
+        return is_market_open_polygon()
+
+
+def create_market_backend(name: str = MARKET_BACKEND):
+    """A market backend is anything with get_share_prices(symbols) and is_market_open()"""
+    if name == "polygon" and polygon_api_key:
+        return PolygonMarket()
+    if name in ("polygon", "simulated"):
+        return simulated_market
+    raise ValueError(f"Unknown market backend {name}")
+
+
+market_backend = create_market_backend()
+
+
+def is_market_open() -> bool:
+    return market_backend.is_market_open()
+
+
+def fetch_share_price(symbol) -> float:
+    return fetch_share_prices([symbol])[symbol]
+
+
+def fetch_share_prices(symbols: list[str]) -> dict[str, float]:
+    return market_backend.get_share_prices(symbols)
+
+
+price_cache = PriceCache(fetch_share_prices)
+
+
+def get_share_prices(symbols) -> dict[str, float]:
+    """
+    Price several symbols at once. Fresh prices come from the cache, and the rest are
+    fetched together in one snapshot call.
+    """
+    return price_cache.get_many(symbols)
+
+
+def get_share_price(symbol) -> float:
+    return get_share_prices([symbol])[symbol]
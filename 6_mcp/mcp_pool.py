@@ -0,0 +1,177 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from agents.mcp import MCPServerStdio
+from accounts_client import session_closed
+from fixtures import mcp_server
+
+CLIENT_SESSION_TIMEOUT_SECONDS = 120
+HEALTH_CHECK_TIMEOUT_SECONDS = 10
+
+
+class PooledServer:
+    """
+    One MCP server subprocess kept running in its own task, so it can be started by one
+    trader, used by many and shut down by the floor without crossing task boundaries.
+    """
+
+    def __init__(self, params: dict, client_session_timeout_seconds: float):
+        self.params = params
+        self.client_session_timeout_seconds = client_session_timeout_seconds
+        self.server: MCPServerStdio | None = None
+        self.users = 0
+        self.retired = False
+        self._task: asyncio.Task | None = None
+        self._stop: asyncio.Event | None = None
+
+    async def _serve(self, ready: asyncio.Future, stop: asyncio.Event):
+        try:
+            server = mcp_server(
+                self.params,
+                cache_tools_list=True,
+                client_session_timeout_seconds=self.client_session_timeout_seconds,
+            )
+            async with server:
+                ready.set_result(server)
+                await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+
+    async def start(self) -> MCPServerStdio:
+        ready = asyncio.get_running_loop().create_future()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._serve(ready, self._stop))
+        self.server = await ready
+        return self.server
+
+    async def stop(self):
+        if self._stop:
+            self._stop.set()
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.server = self._task = self._stop = None
+
+    def is_running(self) -> bool:
+        return (
+            self.server is not None
+            and self.server.session is not None
+            and self._task is not None
+            and not self._task.done()
+            and not session_closed(self.server.session)
+        )
+
+    async def is_healthy(self, timeout: float) -> bool:
+        if not self.is_running():
+            return False
+        try:
+            await asyncio.wait_for(self.server.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+
+class MCPServerPool:
+    """
+    MCP servers shared across the trading floor, started once and kept alive between runs.
+
+    Servers are keyed by their launch parameters, so traders asking for the same server
+    (accounts, push, market, fetch, search) share one process, while servers whose parameters
+    name a trader (its memory database) are effectively per-trader. A server whose process has
+    exited is replaced by the next get(), and check_health() pings every server and replaces any
+    that have crashed or stopped answering.
+
+    Traders check servers out with using() for the length of a run. A server that needs replacing
+    is swapped for a freshly started one, which later runs get, and is only stopped once every
+    run still using it has finished, so no run has its session torn down mid-call.
+    """
+
+    def __init__(
+        self,
+        client_session_timeout_seconds: float = CLIENT_SESSION_TIMEOUT_SECONDS,
+        health_check_timeout: float = HEALTH_CHECK_TIMEOUT_SECONDS,
+    ):
+        self.client_session_timeout_seconds = client_session_timeout_seconds
+        self.health_check_timeout = health_check_timeout
+        self.servers: dict[str, PooledServer] = {}
+        self.restarts = 0
+        self._retired: list[PooledServer] = []
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    @staticmethod
+    def key(params: dict) -> str:
+        return json.dumps(params, sort_keys=True, default=str)
+
+    async def get(self, params: dict) -> MCPServerStdio:
+        """The running server for params, started if need be and checked out until release()"""
+        key = self.key(params)
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            pooled = self.servers.get(key)
+            if pooled is None or not pooled.is_running():
+                pooled = await self._replace(key, params)
+            pooled.users += 1
+            return pooled.server
+
+    async def get_all(self, params_list: list[dict]) -> list[MCPServerStdio]:
+        return list(await asyncio.gather(*[self.get(params) for params in params_list]))
+
+    async def release(self, servers: list[MCPServerStdio]):
+        """Hand back servers from get(), stopping any replaced while they were in use"""
+        for pooled in set(self.servers.values()) | set(self._retired):
+            pooled.users -= sum(server is pooled.server for server in servers)
+        await self._stop_retired()
+
+    @asynccontextmanager
+    async def using(self, params_list: list[dict]):
+        servers = await self.get_all(params_list)
+        try:
+            yield servers
+        finally:
+            await self.release(servers)
+
+    async def _replace(self, key: str, params: dict) -> PooledServer:
+        """Start a new server for key and swap it in; the old one is retired (call with the key's lock held)"""
+        old = self.servers.get(key)
+        if old is not None and not old.retired:
+            old.retired = True
+            self._retired.append(old)
+            self.restarts += 1
+        pooled = PooledServer(params, self.client_session_timeout_seconds)
+        await pooled.start()
+        self.servers[key] = pooled
+        await self._stop_retired()
+        return pooled
+
+    async def _stop_retired(self):
+        idle = [pooled for pooled in self._retired if pooled.users <= 0]
+        self._retired = [pooled for pooled in self._retired if pooled.users > 0]
+        await asyncio.gather(*[pooled.stop() for pooled in idle])
+
+    async def check_health(self) -> int:
+        """Ping every server, replacing those that don't answer; returns how many were replaced"""
+        pooled_servers = list(self.servers.items())
+        healthy = await asyncio.gather(*[pooled.is_healthy(self.health_check_timeout) for _, pooled in pooled_servers])
+        replaced = 0
+        for (key, pooled), ok in zip(pooled_servers, healthy):
+            if not ok:
+                print(f"Restarting MCP server {pooled.params.get('command')} {' '.join(pooled.params.get('args', []))}")
+                async with self._locks[key]:
+                    if self.servers.get(key) is not pooled:
+                        continue
+                    try:
+                        await self._replace(key, pooled.params)
+                    except Exception as e:
+                        print(f"Could not restart MCP server: {e}; will retry when it is next needed")
+                replaced += 1
+        return replaced
+
+    async def close(self):
+        await asyncio.gather(*[pooled.stop() for pooled in list(self.servers.values()) + self._retired])
+        self.servers.clear()
+        self._retired.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
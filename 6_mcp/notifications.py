@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+import requests
+from dotenv import load_dotenv
+from database import write_push, claim_pushes, next_push_due, delete_pushes, retry_pushes
+
+load_dotenv(override=True)
+
+pushover_user = os.getenv("PUSHOVER_USER")
+pushover_token = os.getenv("PUSHOVER_TOKEN")
+# Point this at push_stub.py to test without sending anything
+PUSHOVER_URL = os.getenv("PUSHOVER_URL", "https://api.pushover.net/1/messages.json")
+
+# Notifications arriving within this many seconds of each other are sent as one digest
+PUSH_COALESCE_SECONDS = float(os.getenv("PUSH_COALESCE_SECONDS", "30"))
+PUSH_TIMEOUT_SECONDS = float(os.getenv("PUSH_TIMEOUT_SECONDS", "10"))
+# A failed send is retried after PUSH_BACKOFF_SECONDS, doubling each time up to PUSH_MAX_BACKOFF_SECONDS,
+# and dropped from the outbox after PUSH_MAX_ATTEMPTS
+PUSH_BACKOFF_SECONDS = float(os.getenv("PUSH_BACKOFF_SECONDS", "5"))
+PUSH_MAX_BACKOFF_SECONDS = float(os.getenv("PUSH_MAX_BACKOFF_SECONDS", "600"))
+PUSH_MAX_ATTEMPTS = int(os.getenv("PUSH_MAX_ATTEMPTS", "8"))
+PUSHOVER_MAX_CHARS = 1024
+
+
+def digests(messages: list[tuple[int, str]], max_chars: int = PUSHOVER_MAX_CHARS) -> list[tuple[list[int], str]]:
+    """
+    Group (id, message) pairs, oldest first, into as few digests as fit in max_chars each,
+    returning the ids and text of each. A single message is sent as it is.
+    """
+    groups: list[list[tuple[int, str]]] = []
+    for id, message in messages:
+        message = message[:max_chars]
+        if groups and len(_digest_text(groups[-1] + [(id, message)])) <= max_chars:
+            groups[-1].append((id, message))
+        else:
+            groups.append([(id, message)])
+    return [([id for id, _ in group], _digest_text(group)) for group in groups]
+
+
+def _digest_text(group: list[tuple[int, str]]) -> str:
+    if len(group) == 1:
+        return group[0][1]
+    return "\n".join(f"- {message}" for _, message in group)
+
+
+class PushDispatcher:
+    """
+    Sends push notifications from the push_outbox table on a background thread, so callers
+    only wait for an insert. The outbox is in the database, so notifications queued before a
+    crash or restart are sent by the next dispatcher to start.
+
+    After a notification arrives the thread waits coalesce_seconds for more, then sends everything
+    waiting as one digest (several, past Pushover's message length). A failed digest is retried
+    with exponential backoff, and notifications that fail max_attempts times are dropped. While
+    there is nothing due the thread only sleeps, until a notification arrives or the next retry
+    comes due, looking at the outbox every max_backoff_seconds for notifications queued by other
+    processes. Dispatchers in different processes can share the outbox: each claims the
+    notifications it sends.
+
+    sent counts notifications sent, failed_attempts each failed attempt at sending one, and
+    dropped those given up on.
+    """
+
+    def __init__(
+        self,
+        url: str = PUSHOVER_URL,
+        coalesce_seconds: float = PUSH_COALESCE_SECONDS,
+        timeout_seconds: float = PUSH_TIMEOUT_SECONDS,
+        backoff_seconds: float = PUSH_BACKOFF_SECONDS,
+        max_backoff_seconds: float = PUSH_MAX_BACKOFF_SECONDS,
+        max_attempts: int = PUSH_MAX_ATTEMPTS,
+    ):
+        self.url = url
+        self.coalesce_seconds = coalesce_seconds
+        self.timeout_seconds = timeout_seconds
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_attempts = max_attempts
+        self.sent = 0
+        self.failed_attempts = 0
+        self.dropped = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="push-dispatcher", daemon=True)
+        self._thread.start()
+
+    def send(self, message: str) -> None:
+        """Queue a notification in the outbox and return at once"""
+        write_push(message)
+        self._wake.set()
+
+    def shutdown(self) -> None:
+        """Send whatever is due now, without waiting out the coalescing window, and stop"""
+        if self._thread.is_alive():
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._wait():
+                    self.flush()
+            except Exception as e:
+                print(f"Failed to send push notifications: {e}")
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Failed to send push notifications: {e}")
+
+    def _wait(self) -> bool:
+        """
+        Sleep until a notification is queued, then out the coalescing window, or until the next
+        one in the outbox is due, and say whether there may be any to send
+        """
+        due = next_push_due(self.max_attempts)
+        timeout = self.max_backoff_seconds
+        if due is not None:
+            timeout = min(timeout, max(0.0, due - time.time()))
+        if self._wake.wait(timeout):
+            self._wake.clear()
+            self._stop.wait(self.coalesce_seconds)
+            return True
+        return due is not None and due <= time.time()
+
+    def flush(self) -> int:
+        """Send every notification that is due, returning how many were sent"""
+        sent = 0
+        lease_seconds = self.timeout_seconds * 2
+        while pending := claim_pushes(time.time(), lease_seconds, self.max_attempts):
+            attempts = {id: attempt for id, _, attempt in pending}
+            for ids, text in digests([(id, message) for id, message, _ in pending]):
+                if self.post(text):
+                    delete_pushes(ids)
+                    sent += len(ids)
+                    continue
+                self.failed_attempts += len(ids)
+                exhausted = [id for id in ids if attempts[id] + 1 >= self.max_attempts]
+                if exhausted:
+                    delete_pushes(exhausted)
+                    self.dropped += len(exhausted)
+                    print(f"Dropped {len(exhausted)} push notifications after {self.max_attempts} attempts")
+                if retrying := [id for id in ids if id not in exhausted]:
+                    attempt = max(attempts[id] for id in retrying)
+                    delay = min(self.max_backoff_seconds, self.backoff_seconds * 2**attempt)
+                    retry_pushes(retrying, time.time() + delay)
+        self.sent += sent
+        return sent
+
+    def post(self, text: str) -> bool:
+        payload = {"user": pushover_user, "token": pushover_token, "message": text}
+        try:
+            response = requests.post(self.url, data=payload, timeout=self.timeout_seconds)
+        except requests.RequestException as e:
+            print(f"Push notification failed: {e}")
+            return False
+        if response.status_code >= 400:
+            print(f"Push notification failed with status {response.status_code}: {response.text[:200]}")
+            return False
+        return True
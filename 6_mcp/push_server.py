@@ -1,15 +1,13 @@
-import os
+import atexit
 from dotenv import load_dotenv
-import requests
 from pydantic import BaseModel, Field
 from mcp.server.fastmcp import FastMCP
+from notifications import PushDispatcher
 
 load_dotenv(override=True)
 
-pushover_user = os.getenv("PUSHOVER_USER")
-pushover_token = os.getenv("PUSHOVER_TOKEN")
-pushover_url = "https://api.pushover.net/1/messages.json"
-
+dispatcher = PushDispatcher()
+atexit.register(dispatcher.shutdown)
 
 mcp = FastMCP("push_server")
 
@@ -22,8 +20,7 @@ class PushModelArgs(BaseModel):
 def push(args: PushModelArgs):
     """Send a push notification with this brief message"""
     print(f"Push: {args.message}")
-    payload = {"user": pushover_user, "token": pushover_token, "message": args.message}
-    requests.post(pushover_url, data=payload)
+    dispatcher.send(args.message)
     return "Push notification sent"
 
 
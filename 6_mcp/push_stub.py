@@ -0,0 +1,68 @@
+"""
+A local stand-in for the Pushover API, for testing push notifications without sending any.
+
+    uv run push_stub.py [port]
+    PUSHOVER_URL=http://localhost:8765/1/messages.json uv run trading_floor.py
+
+Each notification received is printed and kept in `received`. The first `failures` requests
+are answered with a 500, to exercise retries.
+"""
+
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+PUSH_STUB_PORT = 8765
+
+
+class PushStub(ThreadingHTTPServer):
+    def __init__(self, port: int = PUSH_STUB_PORT, failures: int = 0):
+        super().__init__(("localhost", port), PushStubHandler)
+        self.received: list[dict] = []
+        self.failures = failures
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://localhost:{self.server_address[1]}/1/messages.json"
+
+    def start(self) -> "PushStub":
+        """Serve on a background thread"""
+        threading.Thread(target=self.serve_forever, name="push-stub", daemon=True).start()
+        return self
+
+
+class PushStubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        fields = {key: values[0] for key, values in parse_qs(body).items()}
+        with self.server.lock:
+            failing = self.server.failures > 0
+            if failing:
+                self.server.failures -= 1
+            else:
+                self.server.received.append(fields)
+        if failing:
+            self.respond(500, {"status": 0, "errors": ["stub failure"]})
+        else:
+            print(f"Push: {fields.get('message')}")
+            self.respond(200, {"status": 1, "request": "stub"})
+
+    def respond(self, status: int, payload: dict):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    stub = PushStub(int(sys.argv[1]) if len(sys.argv) > 1 else PUSH_STUB_PORT)
+    print(f"Push stub listening at {stub.url}")
+    stub.serve_forever()
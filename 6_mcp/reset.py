@@ -1,4 +1,9 @@
-from accounts import Account
+import random
+import sys
+from datetime import datetime
+from accounts import INITIAL_BALANCE, SPREAD
+from database import write_accounts, snapshot_database, restore_database
+from market import get_share_prices
 
 waren_strategy = """
 You are Warren, and you are named in homage to your role model, Warren Buffett.
@@ -39,12 +44,113 @@ You focus your trading on crypto ETFs.
 """
 
 
+# For seeding large populations: a strategy template, and the choices its parameters are drawn from
+
+strategy_template = """
+You are {name}, a {style} investor with a {horizon} horizon.
+You focus on {focus}, and you {approach}.
+You keep to a {risk} level of risk, holding around {positions} positions at a time.
+"""
+
+strategy_parameters = {
+    "style": ["value", "growth", "momentum", "contrarian", "income", "macro", "quantitative"],
+    "horizon": ["short-term", "medium-term", "long-term"],
+    "focus": [
+        "large-cap technology companies",
+        "dividend-paying blue chips",
+        "small-cap companies with strong earnings growth",
+        "sector and broad-market ETFs",
+        "healthcare and biotech",
+        "energy and commodities",
+        "crypto ETFs",
+    ],
+    "approach": [
+        "rely on fundamental analysis of cash flows and balance sheets",
+        "follow price trends and technical indicators",
+        "trade around news and earnings announcements",
+        "rebalance systematically to keep your allocations steady",
+    ],
+    "risk": ["low", "moderate", "high"],
+    "positions": ["5", "10", "20"],
+}
+
+seed_symbols = [
+    "AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "JPM", "V", "JNJ",
+    "XOM", "PG", "KO", "PFE", "DIS", "SPY", "QQQ", "IWM", "XLE", "IBIT",
+]
+
+
+def generate_strategy(name: str, rng: random.Random, template: str = strategy_template, parameters=strategy_parameters) -> str:
+    """Fill in the template with the trader's name and a random choice for each parameter"""
+    return template.format(name=name, **{key: rng.choice(choices) for key, choices in parameters.items()})
+
+
+def generate_account(name: str, rng: random.Random, prices: dict[str, float], holdings: int) -> dict:
+    """A fresh account with the strategy generated, having bought up to `holdings` symbols at today's prices"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    balance, transactions = INITIAL_BALANCE, []
+    for symbol in rng.sample(sorted(prices), min(holdings, len(prices))):
+        price = prices[symbol] * (1 + SPREAD)
+        quantity = int(rng.uniform(0.02, 0.1) * INITIAL_BALANCE // price) if price > 0 else 0
+        if quantity and quantity * price <= balance:
+            balance -= quantity * price
+            transactions.append({
+                "symbol": symbol,
+                "quantity": quantity,
+                "price": price,
+                "timestamp": timestamp,
+                "rationale": "Starting position",
+            })
+    return {
+        "balance": balance,
+        "strategy": generate_strategy(name, rng),
+        "holdings": {t["symbol"]: t["quantity"] for t in transactions},
+        "transactions": transactions,
+    }
+
+
+def seed_traders(
+    count: int,
+    seed: int = 0,
+    holdings: int = 5,
+    symbols: list[str] = seed_symbols,
+    prefix: str = "Trader",
+    digits: int = 4,
+) -> list[str]:
+    """
+    Create or replace `count` accounts named prefix0001 and so on, numbered to `digits` digits
+    whatever the count, so seeding more traders later replaces the same accounts rather than adding
+    differently named ones. Each gets a generated strategy and a starting portfolio, all in one
+    transaction. The same seed gives the same accounts. Returns their names.
+    """
+    rng = random.Random(seed)
+    prices = get_share_prices(symbols)
+    names = [f"{prefix}{i:0{digits}d}" for i in range(1, count + 1)]
+    write_accounts({name: generate_account(name, rng, prices, holdings) for name in names})
+    return names
+
+
 def reset_traders():
-    Account.get("Warren").reset(waren_strategy)
-    Account.get("George").reset(george_strategy)
-    Account.get("Ray").reset(ray_strategy)
-    Account.get("Cathie").reset(cathie_strategy)
+    write_accounts({
+        "Warren": {"balance": INITIAL_BALANCE, "strategy": waren_strategy},
+        "George": {"balance": INITIAL_BALANCE, "strategy": george_strategy},
+        "Ray": {"balance": INITIAL_BALANCE, "strategy": ray_strategy},
+        "Cathie": {"balance": INITIAL_BALANCE, "strategy": cathie_strategy},
+    })
 
 
 if __name__ == "__main__":
-    reset_traders()
+    # uv run reset.py                    reset the four traders
+    # uv run reset.py seed 5000 [seed]   create or replace 5000 generated traders
+    # uv run reset.py snapshot FILE      copy accounts.db to FILE
+    # uv run reset.py restore FILE       put accounts.db back as it was in FILE
+    command = sys.argv[1] if len(sys.argv) > 1 else "reset"
+    if command == "seed":
+        names = seed_traders(int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+        print(f"Seeded {len(names)} traders")
+    elif command == "snapshot":
+        snapshot_database(sys.argv[2])
+    elif command == "restore":
+        restore_database(sys.argv[2])
+    else:
+        reset_traders()
@@ -0,0 +1,201 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from dotenv import load_dotenv
+from database import write_log
+
+load_dotenv(override=True)
+
+# Per model provider: how many traders may run at once, and how many runs may start per minute
+# (with bursts of up to that many; 0 for no limit on run starts)
+MAX_CONCURRENT_RUNS_PER_PROVIDER = int(os.getenv("MAX_CONCURRENT_RUNS_PER_PROVIDER", "4"))
+RUNS_PER_MINUTE_PER_PROVIDER = float(os.getenv("RUNS_PER_MINUTE_PER_PROVIDER", "10"))
+# Each trader starts a random delay of up to this many seconds after the tick
+SCHEDULER_JITTER_SECONDS = float(os.getenv("SCHEDULER_JITTER_SECONDS", "30"))
+RUN_DURATIONS_KEPT = 100
+
+
+class TokenBucket:
+    """Admits up to rate_per_minute acquisitions a minute on average, in bursts of up to capacity"""
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        if rate_per_minute <= 0:
+            raise ValueError(f"A token bucket needs a positive rate, not {rate_per_minute} a minute")
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ProviderLimiter:
+    """
+    Admission control for one provider: a cap on concurrent runs and a token bucket on run starts,
+    left out when runs_per_minute is 0 or less
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_RUNS_PER_PROVIDER,
+        runs_per_minute: float = RUNS_PER_MINUTE_PER_PROVIDER,
+    ):
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.bucket = TokenBucket(runs_per_minute, max(1.0, float(max_concurrent))) if runs_per_minute > 0 else None
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        try:
+            if self.bucket:
+                await self.bucket.acquire()
+        except BaseException:
+            self.semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.semaphore.release()
+
+
+class RunStats:
+    def __init__(self):
+        self.runs = 0
+        self.skipped = 0
+        self.waited = 0.0
+        self.durations = deque(maxlen=RUN_DURATIONS_KEPT)
+
+    def as_dict(self) -> dict:
+        durations = sorted(self.durations)
+        return {
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "last_seconds": self.durations[-1] if durations else None,
+            "p50_seconds": durations[len(durations) // 2] if durations else None,
+            "max_seconds": durations[-1] if durations else None,
+            "admission_wait_seconds": self.waited,
+        }
+
+
+async def every(period_seconds: float, fn, ticks: int | None = None):
+    """
+    Await fn() forever, or the given number of times, on ticks fixed to the start time so they
+    don't drift however long fn takes. Ticks that have already passed are skipped, not run late.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    n = 0
+    while ticks is None or n < ticks:
+        await fn()
+        n += 1
+        if ticks is None or n < ticks:
+            n = max(n, int((loop.time() - start) // period_seconds) + 1)
+            await asyncio.sleep(start + n * period_seconds - loop.time())
+
+
+class Scheduler:
+    """
+    Runs traders every period_seconds, on ticks fixed to the start time so they don't drift
+    however long each tick takes.
+
+    On each tick every trader that isn't still running starts after a random delay of up to
+    jitter_seconds, then waits for admission from its provider's ProviderLimiter, so traders
+    sharing an API key don't all call it at the same instant. A trader still busy from an earlier
+    tick is skipped rather than started twice. Run durations are kept per trader in stats and
+    written to the trader's log. limits gives (max_concurrent, runs_per_minute) for any provider
+    that shouldn't get the defaults.
+    """
+
+    def __init__(
+        self,
+        traders,
+        period_seconds: float,
+        provider_for,
+        jitter_seconds: float = SCHEDULER_JITTER_SECONDS,
+        should_run=None,
+        before_tick=None,
+        max_concurrent: int = MAX_CONCURRENT_RUNS_PER_PROVIDER,
+        runs_per_minute: float = RUNS_PER_MINUTE_PER_PROVIDER,
+        limits: dict[str, tuple[int, float]] | None = None,
+    ):
+        self.traders = traders
+        self.period_seconds = period_seconds
+        self.provider_for = provider_for
+        self.jitter_seconds = min(jitter_seconds, period_seconds / 2)
+        self.should_run = should_run or (lambda: True)
+        self.before_tick = before_tick
+        self.max_concurrent = max_concurrent
+        self.runs_per_minute = runs_per_minute
+        self.limits = limits or {}
+        self.limiters: dict[str, ProviderLimiter] = {}
+        self.stats = {trader.name: RunStats() for trader in traders}
+        self.running: dict[str, asyncio.Task] = {}
+
+    def limiter(self, trader) -> ProviderLimiter:
+        provider = self.provider_for(trader.model_name)
+        if provider not in self.limiters:
+            max_concurrent, runs_per_minute = self.limits.get(provider, (self.max_concurrent, self.runs_per_minute))
+            self.limiters[provider] = ProviderLimiter(max_concurrent, runs_per_minute)
+        return self.limiters[provider]
+
+    async def run_trader(self, trader):
+        stats = self.stats[trader.name]
+        await asyncio.sleep(random.uniform(0, self.jitter_seconds))
+        queued = time.monotonic()
+        async with self.limiter(trader):
+            stats.waited += time.monotonic() - queued
+            start = time.monotonic()
+            try:
+                await trader.run()
+            finally:
+                duration = time.monotonic() - start
+                stats.runs += 1
+                stats.durations.append(duration)
+                write_log(trader.name, "scheduler", f"Run took {duration:.1f}s")
+
+    def tick(self):
+        for trader in self.traders:
+            task = self.running.get(trader.name)
+            if task and not task.done():
+                self.stats[trader.name].skipped += 1
+                write_log(trader.name, "scheduler", "Still running from the last tick; skipped")
+                continue
+            self.running[trader.name] = asyncio.create_task(self.run_trader(trader))
+
+    def running_count(self) -> int:
+        return sum(not task.done() for task in self.running.values())
+
+    async def wait(self):
+        await asyncio.gather(*self.running.values(), return_exceptions=True)
+
+    async def _tick_if_open(self):
+        if await asyncio.to_thread(self.should_run):
+            if self.before_tick:
+                await self.before_tick()
+            self.tick()
+        else:
+            print("Market is closed, skipping run")
+
+    async def run(self, ticks: int | None = None):
+        """Tick forever, or the given number of times, then wait for the last runs to finish"""
+        try:
+            await every(self.period_seconds, self._tick_if_open, ticks)
+            await self.wait()
+        finally:
+            for task in self.running.values():
+                task.cancel()
+
+    def metrics(self) -> dict[str, dict]:
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+SIMULATOR_SEED = int(os.getenv("SIMULATOR_SEED", "42"))
+SIMULATOR_TICK_SECONDS = float(os.getenv("SIMULATOR_TICK_SECONDS", "60"))
+SIMULATOR_EPOCH = os.getenv("SIMULATOR_EPOCH", "2025-01-01")
+
+SECONDS_PER_YEAR = 365.25 * 24 * 60 * 60
+LEVELS = 32  # paths are defined for ticks 0 .. 2**32, which is 8,000 years of minutes
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+_SECOND = np.uint64(0xA0761D6478BD642F)
+_LEVEL_SALTS = np.arange(LEVELS + 1, dtype=np.uint64) * np.uint64(0xD6E8FEB86659FD93)
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    x = x + _GOLDEN
+    x = (x ^ (x >> np.uint64(30))) * _MIX_1
+    x = (x ^ (x >> np.uint64(27))) * _MIX_2
+    return x ^ (x >> np.uint64(31))
+
+
+def _uniform(h: np.ndarray) -> np.ndarray:
+    return ((h >> np.uint64(11)).astype(np.float64) + 0.5) / float(1 << 53)
+
+
+def _normal(keys: np.ndarray, level: int, nodes: np.ndarray) -> np.ndarray:
+    """A standard normal that is a pure function of (symbol key, tree level, node), via Box-Muller"""
+    h = _splitmix64(keys ^ _LEVEL_SALTS[level] ^ _splitmix64(nodes))
+    u1, u2 = _uniform(h), _uniform(_splitmix64(h ^ _SECOND))
+    return np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * u2)
+
+
+def brownian(keys: np.ndarray, ticks: np.ndarray) -> np.ndarray:
+    """
+    Sample standard Brownian motion W(t), in units of ticks, for each (key, tick) pair.
+
+    The path is built top-down as a Brownian bridge: W(2**LEVELS) is drawn first, then each
+    interval's midpoint given its ends, descending to the requested tick. Every draw is a hash of
+    the key and the tree node, so a key's path is fixed and any tick can be read in O(LEVELS),
+    in any order, vectorized across keys and ticks.
+    """
+    keys, ticks = np.broadcast_arrays(np.asarray(keys, dtype=np.uint64), np.asarray(ticks, dtype=np.int64))
+    ticks = np.clip(ticks, 0, 1 << LEVELS)
+    low = np.zeros(ticks.shape, dtype=np.int64)
+    w_low = np.zeros(ticks.shape)
+    w_high = np.sqrt(float(1 << LEVELS)) * _normal(keys, 0, np.zeros(ticks.shape, dtype=np.uint64))
+    for level in range(1, LEVELS + 1):
+        half = 1 << (LEVELS - level)
+        node = (low >> (LEVELS - level + 1)).astype(np.uint64)
+        w_mid = 0.5 * (w_low + w_high) + np.sqrt(half / 2.0) * _normal(keys, level, node)
+        upper = ticks >= low + half
+        low = np.where(upper, low + half, low)
+        w_low = np.where(upper, w_mid, w_low)
+        w_high = np.where(upper, w_high, w_mid)
+    return np.where(ticks == low, w_low, w_high)
+
+
+def brownian_path(keys: np.ndarray, start: int, n_ticks: int) -> np.ndarray:
+    """
+    The same Brownian motion as brownian(), for each key over ticks start .. start + n_ticks - 1,
+    shape (len(keys), n_ticks). Refines the whole range level by level, keeping only the grid
+    points that bracket it, so a path costs O(n_ticks + LEVELS) rather than O(n_ticks * LEVELS).
+    """
+    keys = np.asarray(keys, dtype=np.uint64)[:, None]
+    end = start + n_ticks - 1
+    spacing = 1 << LEVELS
+    grid = np.array([0, spacing], dtype=np.int64)
+    w = np.concatenate(
+        [np.zeros((len(keys), 1)), np.sqrt(float(spacing)) * _normal(keys, 0, np.zeros((1, 1), dtype=np.uint64))],
+        axis=1,
+    )
+    for level in range(1, LEVELS + 1):
+        half = spacing // 2
+        nodes = (grid[:-1] // spacing).astype(np.uint64)
+        w_mid = 0.5 * (w[:, :-1] + w[:, 1:]) + np.sqrt(half / 2.0) * _normal(keys, level, nodes[None, :])
+        refined = np.empty(2 * len(grid) - 1, dtype=np.int64)
+        refined[0::2], refined[1::2] = grid, grid[:-1] + half
+        w_refined = np.empty((len(keys), len(refined)))
+        w_refined[:, 0::2], w_refined[:, 1::2] = w, w_mid
+        keep = (refined >= (start // half) * half) & (refined <= -(-end // half) * half)
+        grid, w, spacing = refined[keep], w_refined[:, keep], half
+    return w
+
+
+def symbol_key(symbol: str, seed: int) -> int:
+    digest = hashlib.blake2b(symbol.encode(), digest_size=8, key=seed.to_bytes(8, "little", signed=True))
+    return int.from_bytes(digest.digest(), "little")
+
+
+class SimulatedMarket:
+    """
+    Offline share prices following geometric Brownian motion.
+
+    Every symbol gets its own starting price, drift and volatility, derived from the seed, and
+    time is divided into ticks of tick_seconds from the epoch. A symbol's price at a tick is the
+    same however and whenever it's asked for, so every lookup within a tick agrees and a whole run
+    can be replayed from the seed. Prices for thousands of symbols are computed in one
+    vectorized pass.
+    """
+
+    def __init__(
+        self,
+        seed: int = SIMULATOR_SEED,
+        tick_seconds: float = SIMULATOR_TICK_SECONDS,
+        epoch: str = SIMULATOR_EPOCH,
+    ):
+        self.seed = seed
+        self.tick_seconds = tick_seconds
+        self.epoch = datetime.fromisoformat(epoch).replace(tzinfo=timezone.utc).timestamp()
+        self.dt = tick_seconds / SECONDS_PER_YEAR
+        self._keys: dict[str, int] = {}
+
+    def keys(self, symbols: list[str]) -> np.ndarray:
+        keys = []
+        for symbol in symbols:
+            key = self._keys.get(symbol)
+            if key is None:
+                key = self._keys[symbol] = symbol_key(symbol, self.seed)
+            keys.append(key)
+        return np.array(keys, dtype=np.uint64)
+
+    def parameters(self, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Starting price ($5-$500, log-uniform), annual drift (-5% to 15%) and volatility (15% to 60%)"""
+        h = _splitmix64(keys ^ np.uint64(0x5EED))
+        u1, u2, u3 = _uniform(h), _uniform(_splitmix64(h)), _uniform(_splitmix64(h ^ _SECOND))
+        start = np.exp(np.log(5.0) + u1 * (np.log(500.0) - np.log(5.0)))
+        return start, -0.05 + 0.20 * u2, 0.15 + 0.45 * u3
+
+    def tick(self, when: float | None = None) -> int:
+        when = time.time() if when is None else when
+        return max(0, int((when - self.epoch) // self.tick_seconds))
+
+    def prices(self, symbols: list[str], ticks) -> np.ndarray:
+        """
+        Prices of the symbols at the given ticks. ticks may be a single tick, one per symbol,
+        or a 2d array of shape (len(symbols), n) to get a path per symbol.
+        """
+        keys = self.keys(symbols)
+        start, drift, volatility = self.parameters(keys)
+        ticks = np.asarray(ticks, dtype=np.int64)
+        if ticks.ndim == 2:
+            keys, start, drift, volatility = (a[:, None] for a in (keys, start, drift, volatility))
+        w = brownian(keys, ticks)
+        log_price = (drift - 0.5 * volatility**2) * ticks * self.dt + volatility * np.sqrt(self.dt) * w
+        return np.round(start * np.exp(log_price), 2)
+
+    def paths(self, symbols: list[str], start_tick: int, n_ticks: int) -> np.ndarray:
+        """Prices for each symbol over n_ticks consecutive ticks, shape (len(symbols), n_ticks)"""
+        keys = self.keys(symbols)
+        start, drift, volatility = (a[:, None] for a in self.parameters(keys))
+        ticks = np.arange(start_tick, start_tick + n_ticks)[None, :]
+        w = brownian_path(keys, start_tick, n_ticks)
+        log_price = (drift - 0.5 * volatility**2) * ticks * self.dt + volatility * np.sqrt(self.dt) * w
+        return np.round(start * np.exp(log_price), 2)
+
+    def get_share_prices(self, symbols: list[str], when: float | None = None) -> dict[str, float]:
+        prices = self.prices(symbols, self.tick(when))
+        return {symbol: float(price) for symbol, price in zip(symbols, prices)}
+
+    def is_market_open(self) -> bool:
+        return True
@@ -8,9 +8,17 @@ elif is_paid_polygon:
 else:
     note = "You have access to end of day market data; use you get_share_price tool to get the share price as of the prior close."
 
+# Instructions never embed the time, and each message puts the strategy, account and datetime
+# last, so everything before them is identical from run to run and can be served from the
+# provider's prompt cache.
+
+
+def current_datetime():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
 
 def researcher_instructions():
-    return f"""You are a financial researcher. You are able to search the web for interesting financial news,
+    return """You are a financial researcher. You are able to search the web for interesting financial news,
 look for possible trading opportunities, and help with research.
 Based on the request, you carry out necessary research and respond with your findings.
 Take time to make multiple searches to get a comprehensive overview, and then summarize your findings.
@@ -24,14 +32,14 @@ Also use it to store web addresses that you find interesting so you can check th
 Draw on your knowledge graph to build your expertise over time.
 
 If there isn't a specific request, then just respond with investment opportunities based on searching latest news.
-The current datetime is {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+The current datetime is given in the request; use it to judge how recent the news you find is.
 """
 
 def research_tool():
     return "This tool researches online for news and opportunities, \
 either based on your specific request to look into a certain stock, \
 or generally for notable financial news and opportunities. \
-Describe what kind of research you're looking for."
+Describe what kind of research you're looking for, and include the current datetime."
 
 def trader_instructions(name: str):
     return f"""
@@ -39,7 +47,7 @@ You are {name}, a trader on the stock market. Your account is under your name, {
 You actively manage your portfolio according to your strategy.
 You have access to tools including a researcher to research online for news and opportunities, based on your request.
 You also have tools to access to financial data for stocks. {note}
-And you have tools to buy and sell stocks using your account name {name}.
+And you have tools to buy and sell stocks using your account name {name}; use execute_trades to make several trades in one step.
 You can use your entity tools as a persistent memory to store and recall information; you share
 this memory with other traders and can benefit from the group's knowledge.
 Use these tools to carry out research, make decisions, and execute trades.
@@ -56,15 +64,16 @@ Finally, make you decision, then execute trades using the tools.
 Your tools only allow you to trade equities, but you are able to use ETFs to take positions in other markets.
 You do not need to rebalance your portfolio; you will be asked to do so later.
 Just make trades based on your strategy as needed.
+Your account name is {name}.
+After you've executed your trades, send a push notification with a brief sumnmary of trades and the health of the portfolio, then
+respond with a brief 2-3 sentence appraisal of your portfolio and its outlook.
 Your investment strategy:
 {strategy}
 Here is your current account:
 {account}
 Here is the current datetime:
-{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-Now, carry out analysis, make your decision and execute trades. Your account name is {name}.
-After you've executed your trades, send a push notification with a brief sumnmary of trades and the health of the portfolio, then
-respond with a brief 2-3 sentence appraisal of your portfolio and its outlook.
+{current_datetime()}
+Now, carry out analysis, make your decision and execute trades.
 """
 
 def rebalance_message(name, strategy, account):
@@ -74,13 +83,14 @@ Use the tools to research stock price and other company information affecting yo
 Finally, make you decision, then execute trades using the tools as needed.
 You do not need to identify new investment opportunities at this time; you will be asked to do so later.
 Just rebalance your portfolio based on your strategy as needed.
+You also have a tool to change your strategy if you wish; you can decide at any time that you would like to evolve or even switch your strategy.
+Your account name is {name}.
+After you've executed your trades, send a push notification with a brief sumnmary of trades and the health of the portfolio, then
+respond with a brief 2-3 sentence appraisal of your portfolio and its outlook.
 Your investment strategy:
 {strategy}
-You also have a tool to change your strategy if you wish; you can decide at any time that you would like to evolve or even switch your strategy.
 Here is your current account:
 {account}
 Here is the current datetime:
-{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-Now, carry out analysis, make your decision and execute trades. Your account name is {name}.
-After you've executed your trades, send a push notification with a brief sumnmary of trades and the health of the portfolio, then
-respond with a brief 2-3 sentence appraisal of your portfolio and its outlook."""
\ No newline at end of file
+{current_datetime()}
+Now, carry out analysis, make your decision and execute trades."""
\ No newline at end of file
@@ -0,0 +1,67 @@
+import os
+import signal
+import sys
+import tempfile
+import textwrap
+import unittest
+from mcp import StdioServerParameters
+from mcp.shared.exceptions import McpError
+from accounts_client import AccountsSession
+
+SERVER = textwrap.dedent('''
+    import os
+    from mcp.server.fastmcp import FastMCP
+
+    mcp = FastMCP("test_server")
+
+    @mcp.tool()
+    async def pid() -> int:
+        return os.getpid()
+
+    @mcp.tool()
+    async def echo(text: str) -> str:
+        return text
+
+    @mcp.tool()
+    async def die() -> str:
+        os._exit(1)
+
+    if __name__ == "__main__":
+        mcp.run(transport="stdio")
+''')
+
+
+def text(result) -> str:
+    return result.content[0].text
+
+
+class TestAccountsSession(unittest.IsolatedAsyncioTestCase):
+    """Tests for AccountsSession reconnecting to a server that has died"""
+
+    async def asyncSetUp(self):
+        directory = tempfile.mkdtemp(prefix="test_accounts_client_")
+        script = os.path.join(directory, "server.py")
+        with open(script, "w") as f:
+            f.write(SERVER)
+        self.session = AccountsSession(StdioServerParameters(command=sys.executable, args=[script]))
+
+    async def asyncTearDown(self):
+        await self.session.close()
+
+    async def test_server_killed_between_calls(self):
+        """A call after the server is killed starts a fresh one and succeeds"""
+        pid = int(text(await self.session.request("call_tool", "pid", {})))
+        os.kill(pid, signal.SIGKILL)
+        self.assertEqual(text(await self.session.request("call_tool", "echo", {"text": "hello"})), "hello")
+        self.assertNotEqual(int(text(await self.session.request("call_tool", "pid", {}))), pid)
+
+    async def test_server_dies_during_call(self):
+        """The call that kills the server fails, but the next one gets a fresh server"""
+        with self.assertRaises(McpError):
+            await self.session.request("call_tool", "die", {})
+        self.assertGreaterEqual(self.session.reconnects, 1)
+        self.assertEqual(text(await self.session.request("call_tool", "echo", {"text": "hello"})), "hello")
+
+
+if __name__ == "__main__":
+    unittest.main()
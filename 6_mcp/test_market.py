@@ -0,0 +1,61 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+# market imports database, which opens and migrates ACCOUNTS_DB on import; keep it off the real one
+os.environ["ACCOUNTS_DB"] = os.path.join(tempfile.mkdtemp(prefix="test_market_"), "accounts.db")
+
+from market import PriceCache  # noqa: E402  (must be imported after ACCOUNTS_DB is set)
+
+
+class TestPriceCache(unittest.TestCase):
+    """Tests for PriceCache.get_many"""
+
+    def test_fetch_missing_a_symbol(self):
+        """A symbol the fetch leaves out is priced 0.0, and later callers don't hang on it"""
+        cache = PriceCache(lambda symbols: {symbol: 100.0 for symbol in symbols if symbol != "GONE"})
+        self.assertEqual(cache.get_many(["AAPL", "GONE"]), {"AAPL": 100.0, "GONE": 0.0})
+        self.assertEqual(cache._in_flight, {})
+        self.assertEqual(cache.get_many(["GONE"]), {"GONE": 0.0})
+
+    def test_waiter_on_symbol_missing_from_fetch(self):
+        """A caller waiting on another thread's fetch gets a result even when the fetch drops its symbol"""
+        started = threading.Event()
+
+        def slow_fetch(symbols):
+            started.set()
+            time.sleep(0.2)
+            return {}
+
+        cache = PriceCache(slow_fetch)
+        first = threading.Thread(target=cache.get_many, args=(["GONE"],))
+        first.start()
+        started.wait()
+        result = {}
+        second = threading.Thread(target=lambda: result.update(cache.get_many(["GONE"])))
+        second.start()
+        second.join(timeout=5)
+        first.join(timeout=5)
+        self.assertFalse(second.is_alive())
+        self.assertEqual(result, {"GONE": 0.0})
+
+    def test_fetch_error_reaches_waiters(self):
+        """If the fetch raises, the caller sees the error and the symbol can be fetched again"""
+        calls = []
+
+        def failing_fetch(symbols):
+            calls.append(symbols)
+            if len(calls) == 1:
+                raise ConnectionError("down")
+            return {symbol: 1.0 for symbol in symbols}
+
+        cache = PriceCache(failing_fetch)
+        with self.assertRaises(ConnectionError):
+            cache.get_many(["AAPL"])
+        self.assertEqual(cache.get_many(["AAPL"]), {"AAPL": 1.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
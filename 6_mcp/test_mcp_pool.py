@@ -0,0 +1,43 @@
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import unittest
+from mcp_pool import MCPServerPool
+from test_accounts_client import SERVER, text
+
+
+class TestMCPServerPool(unittest.IsolatedAsyncioTestCase):
+    """Tests for MCPServerPool replacing servers that have died"""
+
+    async def asyncSetUp(self):
+        directory = tempfile.mkdtemp(prefix="test_mcp_pool_")
+        script = os.path.join(directory, "server.py")
+        with open(script, "w") as f:
+            f.write(SERVER)
+        self.params = {"command": sys.executable, "args": [script]}
+        self.pool = MCPServerPool()
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    async def test_get_replaces_crashed_server(self):
+        """A server whose process has exited is replaced by the next get(), without waiting for check_health"""
+        async with self.pool.using([self.params]) as [server]:
+            pid = int(text(await server.call_tool("pid", {})))
+        os.kill(pid, signal.SIGKILL)
+        pooled = self.pool.servers[self.pool.key(self.params)]
+        for _ in range(100):
+            if not pooled.is_running():
+                break
+            await asyncio.sleep(0.05)
+        self.assertFalse(pooled.is_running())
+        async with self.pool.using([self.params]) as [server]:
+            self.assertEqual(text(await server.call_tool("echo", {"text": "hello"})), "hello")
+            self.assertNotEqual(int(text(await server.call_tool("pid", {}))), pid)
+        self.assertEqual(self.pool.restarts, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
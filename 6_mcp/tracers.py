@@ -1,75 +1,137 @@
 from agents import TracingProcessor, Trace, Span
-from database import write_log
+from log_sink import LogSink
+from dotenv import load_dotenv
+import os
 import secrets
-import string
+import time
+
+load_dotenv(override=True)
+
+# Record each span's timing and token usage in the spans table, as well as the Started/Ended log rows
+RECORD_SPANS = os.getenv("RECORD_SPANS", "true").strip().lower() == "true"
+
+# trace_id -> trader name, registered when the id is made and evicted when the trace ends
+trace_names: dict[str, str] = {}
+TRACE_NAMES_KEPT = 10_000
 
-ALPHANUM = string.ascii_lowercase + string.digits 
 
 def make_trace_id(tag: str) -> str:
     """
-    Return a string of the form 'trace_<tag><random>',
-    where the total length after 'trace_' is 32 chars.
+    Return a string of the form 'trace_<tag>0<random>',
+    where the total length after 'trace_' is 32 chars, and register the id as belonging to tag.
     """
     tag += "0"
     pad_len = 32 - len(tag)
-    random_suffix = ''.join(secrets.choice(ALPHANUM) for _ in range(pad_len))
-    return f"trace_{tag}{random_suffix}"
+    trace_id = f"trace_{tag}{secrets.token_hex(16)[:pad_len]}"
+    trace_names[trace_id] = tag[:-1]
+    if len(trace_names) > TRACE_NAMES_KEPT:
+        # Ids whose traces never ended, e.g. with no LogTracer installed: forget the oldest
+        del trace_names[next(iter(trace_names))]
+    return trace_id
+
+
+def name_from_trace_id(trace_id: str) -> str | None:
+    """Recover the tag from an id made by make_trace_id in another process, or before it was registered"""
+    name = trace_id.split("_")[1]
+    if '0' in name:
+        return name.split("0")[0]
+    else:
+        return None
+
+
+def describe(verb: str, span: Span) -> str:
+    message = verb
+    if span.span_data:
+        if span.span_data.type:
+            message += f" {span.span_data.type}"
+        if hasattr(span.span_data, "name") and span.span_data.name:
+            message += f" {span.span_data.name}"
+        if hasattr(span.span_data, "server") and span.span_data.server:
+            message += f" {span.span_data.server}"
+    if span.error:
+        message += f" {span.error}"
+    return message
+
+
+def span_details(span: Span) -> tuple[str | None, str | None, str | None, int | None, int | None]:
+    """The name, MCP server, model and input and output token counts of a span, where it has them"""
+    data = span.span_data
+    name = getattr(data, "name", None)
+    server = getattr(data, "server", None) or (getattr(data, "mcp_data", None) or {}).get("server")
+    model = getattr(data, "model", None)
+    usage = getattr(data, "usage", None)
+    response = getattr(data, "response", None)
+    if response is not None:
+        model = model or getattr(response, "model", None)
+        usage = usage or getattr(response, "usage", None)
+    if usage is None:
+        return name, server, model, None, None
+    if isinstance(usage, dict):
+        return name, server, model, usage.get("input_tokens"), usage.get("output_tokens")
+    return name, server, model, getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None)
+
 
 class LogTracer(TracingProcessor):
+    """
+    Writes a log row as each trace and span starts and ends, for the trader named in the trace id.
+    The trader's name is looked up once, when the trace starts, and kept until it ends, so span
+    events cost a dict lookup. With record_spans, each span's duration and token usage is also
+    written as a row of the spans table.
+    """
+
+    def __init__(self, sink: LogSink | None = None, record_spans: bool = RECORD_SPANS):
+        self.sink = sink or LogSink()
+        self.record_spans = record_spans
+        self.names: dict[str, str | None] = {}
+        self.started: dict[str, float] = {}
 
     def get_name(self, trace_or_span: Trace | Span) -> str | None:
         trace_id = trace_or_span.trace_id
-        name = trace_id.split("_")[1]
-        if '0' in name:
-            return name.split("0")[0]
-        else:
-            return None
+        try:
+            return self.names[trace_id]
+        except KeyError:
+            return trace_names.get(trace_id) or name_from_trace_id(trace_id)
 
     def on_trace_start(self, trace) -> None:
-        name = self.get_name(trace)
+        name = self.names[trace.trace_id] = self.get_name(trace)
         if name:
-            write_log(name, "trace", f"Started: {trace.name}")
+            self.sink.write(name, "trace", f"Started: {trace.name}")
 
     def on_trace_end(self, trace) -> None:
         name = self.get_name(trace)
+        self.names.pop(trace.trace_id, None)
+        trace_names.pop(trace.trace_id, None)
         if name:
-            write_log(name, "trace", f"Ended: {trace.name}")
+            self.sink.write(name, "trace", f"Ended: {trace.name}")
 
     def on_span_start(self, span) -> None:
         name = self.get_name(span)
-        type = span.span_data.type if span.span_data else "span"
         if name:
-            message = "Started"
-            if span.span_data:
-                if span.span_data.type:
-                    message += f" {span.span_data.type}"
-                if hasattr(span.span_data, "name") and span.span_data.name:
-                    message += f" {span.span_data.name}"
-                if hasattr(span.span_data, "server") and span.span_data.server:
-                    message += f" {span.span_data.server}"
-            if span.error:
-                message += f" {span.error}"
-            write_log(name, type, message)
+            if self.record_spans:
+                self.started[span.span_id] = time.perf_counter()
+            type = span.span_data.type if span.span_data else "span"
+            self.sink.write(name, type, describe("Started", span))
 
     def on_span_end(self, span) -> None:
         name = self.get_name(span)
-        type = span.span_data.type if span.span_data else "span"
         if name:
-            message = "Ended"
-            if span.span_data:
-                if span.span_data.type:
-                    
-                    message += f" {span.span_data.type}"
-                if hasattr(span.span_data, "name") and span.span_data.name:
-                    message += f" {span.span_data.name}"
-                if hasattr(span.span_data, "server") and span.span_data.server:
-                    message += f" {span.span_data.server}"
-            if span.error:
-                message += f" {span.error}"
-            write_log(name, type, message)
+            type = span.span_data.type if span.span_data else "span"
+            self.sink.write(name, type, describe("Ended", span))
+            if self.record_spans:
+                self.write_span(name, type, span)
+
+    def write_span(self, name: str, type: str, span: Span) -> None:
+        started = self.started.pop(span.span_id, None)
+        duration_ms = (time.perf_counter() - started) * 1000 if started is not None else None
+        label, server, model, input_tokens, output_tokens = span_details(span)
+        error = span.error.get("message") if span.error else None
+        self.sink.write_span((
+            span.span_id, span.trace_id, span.parent_id, name, type, label, server, model,
+            span.started_at, span.ended_at, duration_ms, input_tokens, output_tokens, error,
+        ))
 
     def force_flush(self) -> None:
-        pass
+        self.sink.flush()
 
     def shutdown(self) -> None:
-        pass
\ No newline at end of file
+        self.sink.shutdown()
@@ -0,0 +1,117 @@
+import json
+import os
+from functools import lru_cache
+from dotenv import load_dotenv
+from database import write_log
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+load_dotenv(override=True)
+
+# The tokenizer used to measure messages; providers differ, but the counts are for comparison
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "o200k_base")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text, or an estimate of about four characters a token without tiktoken"""
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def _rounded(value):
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {key: _rounded(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rounded(item) for item in value]
+    return value
+
+
+def _transaction_key(transaction: dict) -> tuple:
+    return transaction["timestamp"], transaction["symbol"], transaction["quantity"], transaction["price"]
+
+
+class TraderContext:
+    """
+    Builds the message for each of a trader's runs from its account report, and measures it.
+
+    The account goes in as compact JSON, with amounts to the cent and without the name and strategy
+    the message already gives. The first run shows the recent transactions; later runs show only
+    the transactions made since the previous run, and how the portfolio value has moved, since the
+    holdings already give the current position. Each message is logged with its size in tokens,
+    how many fewer that is than with the "recent" view report pasted in as it comes (what the
+    message held before), and how many of its leading tokens are unchanged from the last message
+    of the same kind - the part a provider's prompt cache can serve.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seen: set[tuple] | None = None
+        self.last_value: float | None = None
+        self.previous: dict[str, str] = {}
+        self.runs = 0
+        self.tokens = 0
+        self.tokens_saved_vs_recent = 0
+        self.tokens_cacheable = 0
+
+    def account(self, report: str) -> str:
+        """The compact account for this run, from a "recent" view report"""
+        data = json.loads(report)
+        data.pop("name", None)
+        data.pop("strategy", None)
+        transactions = data.pop("recent_transactions", [])
+        keys = [_transaction_key(transaction) for transaction in transactions]
+        if self.seen is None:
+            data["recent_transactions"] = transactions
+        else:
+            data["transactions_since_last_run"] = [
+                transaction for transaction, key in zip(transactions, keys) if key not in self.seen
+            ]
+            if self.last_value is not None and "total_portfolio_value" in data:
+                data["portfolio_value_change_since_last_run"] = data["total_portfolio_value"] - self.last_value
+        self.seen = set(keys)
+        self.last_value = data.get("total_portfolio_value")
+        return json.dumps(_rounded(data), separators=(",", ":"))
+
+    def message(self, template, strategy: str, report: str) -> str:
+        """template(name, strategy, account) - trade_message or rebalance_message - filled in for this run"""
+        message = template(self.name, strategy, self.account(report))
+        tokens = count_tokens(message)
+        saved_vs_recent = count_tokens(template(self.name, strategy, report)) - tokens
+        cacheable = count_tokens(os.path.commonprefix([self.previous.get(template.__name__, ""), message]))
+        self.previous[template.__name__] = message
+        self.runs += 1
+        self.tokens += tokens
+        self.tokens_saved_vs_recent += saved_vs_recent
+        self.tokens_cacheable += cacheable
+        write_log(
+            self.name,
+            "context",
+            f"Message of {tokens} tokens, {saved_vs_recent} fewer than with the recent view report as is; "
+            f"the first {cacheable} unchanged since the last one",
+        )
+        return message
+
+    def metrics(self) -> dict:
+        return {
+            "runs": self.runs,
+            "tokens": self.tokens,
+            "tokens_saved_vs_recent": self.tokens_saved_vs_recent,
+            "tokens_cacheable": self.tokens_cacheable,
+        }
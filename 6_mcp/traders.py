@@ -1,12 +1,13 @@
 from contextlib import AsyncExitStack
 from accounts_client import read_accounts_resource, read_strategy_resource
 from tracers import make_trace_id
-from agents import Agent, Tool, Runner, OpenAIChatCompletionsModel, trace
-from openai import AsyncOpenAI
+from trader_context import TraderContext
+from fixtures import http_transport, mcp_server
+from agents import Agent, Runner, OpenAIChatCompletionsModel, trace, set_default_openai_client
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
+import httpx
 import os
-import json
-from agents.mcp import MCPServerStdio
 from templates import (
     researcher_instructions,
     trader_instructions,
@@ -30,23 +31,72 @@ OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 
 MAX_TURNS = 30
 
-openrouter_client = AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=openrouter_api_key)
-deepseek_client = AsyncOpenAI(base_url=DEEPSEEK_BASE_URL, api_key=deepseek_api_key)
-grok_client = AsyncOpenAI(base_url=GROK_BASE_URL, api_key=grok_api_key)
-gemini_client = AsyncOpenAI(base_url=GEMINI_BASE_URL, api_key=google_api_key)
+# Each provider's client keeps its own pool of connections, kept alive between runs: at most
+# this many open at once, and this many idle ones kept for this many seconds
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "100"))
+PROVIDER_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("PROVIDER_MAX_KEEPALIVE_CONNECTIONS", "20"))
+PROVIDER_KEEPALIVE_SECONDS = float(os.getenv("PROVIDER_KEEPALIVE_SECONDS", "60"))
+
+
+def make_client(base_url: str | None = None, api_key: str | None = None) -> AsyncOpenAI:
+    """
+    A client for one provider, with a connection pool sized by the PROVIDER_* settings, or
+    recording or replaying its requests as FIXTURES says
+    """
+    limits = httpx.Limits(
+        max_connections=PROVIDER_MAX_CONNECTIONS,
+        max_keepalive_connections=PROVIDER_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=PROVIDER_KEEPALIVE_SECONDS,
+    )
+    http_client = DefaultAsyncHttpxClient(limits=limits, transport=http_transport(limits))
+    return AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client)
+
+
+openrouter_client = make_client(OPENROUTER_BASE_URL, openrouter_api_key)
+deepseek_client = make_client(DEEPSEEK_BASE_URL, deepseek_api_key)
+grok_client = make_client(GROK_BASE_URL, grok_api_key)
+gemini_client = make_client(GEMINI_BASE_URL, google_api_key)
+if os.getenv("OPENAI_API_KEY"):
+    # Used by the Agents SDK for models named without a provider, such as gpt-4o-mini
+    set_default_openai_client(make_client())
+
+# The first of these found in a model's name picks its provider and client; any other model is
+# OpenAI's, served by the Agents SDK's default client
+PROVIDERS = [
+    ("/", "openrouter", openrouter_client),
+    ("deepseek", "deepseek", deepseek_client),
+    ("grok", "grok", grok_client),
+    ("gemini", "gemini", gemini_client),
+]
+DEFAULT_PROVIDER = "openai"
+
+_models: dict[str, OpenAIChatCompletionsModel | str] = {}
 
 
 def get_model(model_name: str):
-    if "/" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=openrouter_client)
-    elif "deepseek" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=deepseek_client)
-    elif "grok" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=grok_client)
-    elif "gemini" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=gemini_client)
-    else:
+    """The model for a name, made once and shared by every agent that uses it"""
+    if model_name not in _models:
+        _models[model_name] = make_model(model_name)
+    return _models[model_name]
+
+
+def _provider(model_name: str) -> tuple[str, AsyncOpenAI | None]:
+    for marker, provider, client in PROVIDERS:
+        if marker in model_name:
+            return provider, client
+    return DEFAULT_PROVIDER, None
+
+
+def make_model(model_name: str):
+    _, client = _provider(model_name)
+    if client is None:
         return model_name
+    return OpenAIChatCompletionsModel(model=model_name, openai_client=client)
+
+
+def get_provider(model_name: str) -> str:
+    """The API a model is served from, matching get_model; traders on the same provider share its rate limits"""
+    return _provider(model_name)[0]
 
 
 async def get_researcher(mcp_servers, model_name) -> Agent:
@@ -59,21 +109,28 @@ async def get_researcher(mcp_servers, model_name) -> Agent:
     return researcher
 
 
-async def get_researcher_tool(mcp_servers, model_name) -> Tool:
-    researcher = await get_researcher(mcp_servers, model_name)
-    return researcher.as_tool(tool_name="Researcher", tool_description=research_tool())
-
-
 class Trader:
-    def __init__(self, name: str, lastname="Trader", model_name="gpt-4o-mini"):
+    """
+    An agent that trades one account. Its agent and the researcher agent it uses as a tool are
+    built on the first run and kept: later runs only hand them the MCP servers for that run, and
+    they are rebuilt only when model_name changes. Neither depends on the strategy, which is sent
+    with each run's message.
+    """
+
+    def __init__(self, name: str, lastname="Trader", model_name="gpt-4o-mini", mcp_pool=None):
         self.name = name
         self.lastname = lastname
         self.agent = None
+        self.researcher = None
+        self.agent_model_name = None
         self.model_name = model_name
         self.do_trade = True
+        self.mcp_pool = mcp_pool
+        self.context = TraderContext(name)
 
     async def create_agent(self, trader_mcp_servers, researcher_mcp_servers) -> Agent:
-        tool = await get_researcher_tool(researcher_mcp_servers, self.model_name)
+        self.researcher = await get_researcher(researcher_mcp_servers, self.model_name)
+        tool = self.researcher.as_tool(tool_name="Researcher", tool_description=research_tool())
         self.agent = Agent(
             name=self.name,
             instructions=trader_instructions(self.name),
@@ -81,37 +138,44 @@ class Trader:
             tools=[tool],
             mcp_servers=trader_mcp_servers,
         )
+        self.agent_model_name = self.model_name
+        return self.agent
+
+    async def get_agent(self, trader_mcp_servers, researcher_mcp_servers) -> Agent:
+        """The cached agent, given this run's MCP servers, or a new one if the model has changed"""
+        if self.agent is None or self.agent_model_name != self.model_name:
+            return await self.create_agent(trader_mcp_servers, researcher_mcp_servers)
+        self.agent.mcp_servers = trader_mcp_servers
+        self.researcher.mcp_servers = researcher_mcp_servers
         return self.agent
 
     async def get_account_report(self) -> str:
-        account = await read_accounts_resource(self.name)
-        account_json = json.loads(account)
-        account_json.pop("portfolio_value_time_series", None)
-        return json.dumps(account_json)
+        return await read_accounts_resource(self.name, "recent")
 
     async def run_agent(self, trader_mcp_servers, researcher_mcp_servers):
-        self.agent = await self.create_agent(trader_mcp_servers, researcher_mcp_servers)
+        agent = await self.get_agent(trader_mcp_servers, researcher_mcp_servers)
         account = await self.get_account_report()
         strategy = await read_strategy_resource(self.name)
-        message = (
-            trade_message(self.name, strategy, account)
-            if self.do_trade
-            else rebalance_message(self.name, strategy, account)
-        )
-        await Runner.run(self.agent, message, max_turns=MAX_TURNS)
+        message = self.context.message(trade_message if self.do_trade else rebalance_message, strategy, account)
+        await Runner.run(agent, message, max_turns=MAX_TURNS)
 
     async def run_with_mcp_servers(self):
+        if self.mcp_pool:
+            async with self.mcp_pool.using(trader_mcp_server_params) as trader_mcp_servers:
+                async with self.mcp_pool.using(researcher_mcp_server_params(self.name)) as researcher_mcp_servers:
+                    await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
+            return
         async with AsyncExitStack() as stack:
             trader_mcp_servers = [
                 await stack.enter_async_context(
-                    MCPServerStdio(params, client_session_timeout_seconds=120)
+                    mcp_server(params, client_session_timeout_seconds=120)
                 )
                 for params in trader_mcp_server_params
             ]
             async with AsyncExitStack() as stack:
                 researcher_mcp_servers = [
                     await stack.enter_async_context(
-                        MCPServerStdio(params, client_session_timeout_seconds=120)
+                        mcp_server(params, client_session_timeout_seconds=120)
                     )
                     for params in researcher_mcp_server_params(self.name)
                 ]
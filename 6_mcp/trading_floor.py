@@ -1,7 +1,9 @@
-from traders import Trader
+from traders import Trader, get_provider
 from typing import List
 import asyncio
 from tracers import LogTracer
+from mcp_pool import MCPServerPool
+from scheduler import Scheduler
 from agents import add_trace_processor
 from market import is_market_open
 from dotenv import load_dotenv
@@ -14,6 +16,8 @@ RUN_EVEN_WHEN_MARKET_IS_CLOSED = (
     os.getenv("RUN_EVEN_WHEN_MARKET_IS_CLOSED", "false").strip().lower() == "true"
 )
 USE_MANY_MODELS = os.getenv("USE_MANY_MODELS", "false").strip().lower() == "true"
+# More than 1 shards the traders across this many worker processes
+TRADING_FLOOR_WORKERS = int(os.getenv("TRADING_FLOOR_WORKERS", "1"))
 
 names = ["Warren", "George", "Ray", "Cathie"]
 lastnames = ["Patience", "Bold", "Systematic", "Crypto"]
@@ -31,24 +35,44 @@ else:
     short_model_names = ["GPT 4o mini"] * 4
 
 
-def create_traders() -> List[Trader]:
+def trader_specs() -> List[tuple[str, str, str]]:
+    return list(zip(names, lastnames, model_names))
+
+
+def create_traders(mcp_pool: MCPServerPool | None = None) -> List[Trader]:
     traders = []
-    for name, lastname, model_name in zip(names, lastnames, model_names):
-        traders.append(Trader(name, lastname, model_name))
+    for name, lastname, model_name in trader_specs():
+        traders.append(Trader(name, lastname, model_name, mcp_pool=mcp_pool))
     return traders
 
 
+def should_run() -> bool:
+    return RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open()
+
+
 async def run_every_n_minutes():
     add_trace_processor(LogTracer())
-    traders = create_traders()
-    while True:
-        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open():
-            await asyncio.gather(*[trader.run() for trader in traders])
-        else:
-            print("Market is closed, skipping run")
-        await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
+    async with MCPServerPool() as mcp_pool:
+        scheduler = Scheduler(
+            create_traders(mcp_pool),
+            RUN_EVERY_N_MINUTES * 60,
+            get_provider,
+            should_run=should_run,
+            before_tick=mcp_pool.check_health,
+        )
+        await scheduler.run()
+
+
+async def run_sharded_every_n_minutes(workers: int = TRADING_FLOOR_WORKERS):
+    from floor_workers import ShardedFloor
+
+    floor = ShardedFloor(trader_specs(), workers, RUN_EVERY_N_MINUTES * 60)
+    await floor.run(should_run)
 
 
 if __name__ == "__main__":
     print(f"Starting scheduler to run every {RUN_EVERY_N_MINUTES} minutes")
-    asyncio.run(run_every_n_minutes())
+    if TRADING_FLOOR_WORKERS > 1:
+        asyncio.run(run_sharded_every_n_minutes())
+    else:
+        asyncio.run(run_every_n_minutes())
@@ -0,0 +1,46 @@
+import time
+from market import get_share_prices, PRICE_CACHE_SECONDS
+
+
+class PortfolioValuation:
+    """
+    The market value of a set of holdings, priced from one batched snapshot.
+
+    After a trade only the traded symbol is re-valued, using the price the trade was made at,
+    so reporting straight after a buy or sell costs no further price lookups. The whole
+    portfolio is re-priced in a single call once the snapshot is older than ttl seconds.
+    """
+
+    def __init__(self, ttl: float = PRICE_CACHE_SECONDS):
+        self.ttl = ttl
+        self.prices: dict[str, float] = {}
+        self.values: dict[str, float] = {}
+        self.total = 0.0
+        self.priced_at = None
+
+    def is_stale(self, holdings: dict[str, int]) -> bool:
+        if self.priced_at is None or time.monotonic() - self.priced_at >= self.ttl:
+            return True
+        return holdings.keys() != self.values.keys()
+
+    def refresh(self, holdings: dict[str, int]) -> float:
+        self.prices = get_share_prices(list(holdings)) if holdings else {}
+        self.values = {symbol: self.prices[symbol] * quantity for symbol, quantity in holdings.items()}
+        self.total = sum(self.values.values())
+        self.priced_at = time.monotonic()
+        return self.total
+
+    def holdings_value(self, holdings: dict[str, int]) -> float:
+        if self.is_stale(holdings):
+            return self.refresh(holdings)
+        return self.total
+
+    def update(self, symbol: str, quantity: int, price: float) -> None:
+        """Re-value one holding after a trade; a quantity of 0 removes it"""
+        if self.priced_at is None:
+            return
+        self.total -= self.values.pop(symbol, 0.0)
+        self.prices[symbol] = price
+        if quantity:
+            self.values[symbol] = price * quantity
+            self.total += self.values[symbol]